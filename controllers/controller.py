@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+P4Runtime failover controller.
+
+One process controls any number of switches; what a switch does when a PDC
+fails comes from topology.json, pdc_config.json and failover_policy.json
+(see failover.py). Switches are brought up (arbitration, pipeline push,
+static rules, digest registration) concurrently, sharing one P4Info index
+and one entry cache, so a cold start takes about as long as the slowest
+switch. A switch that already runs this P4 program (same pipeline cookie)
+is not re-pushed: the controller reads its entries, recovers the failover
+states from the installed reroutes and writes only the differences, so a
+controller restart leaves forwarding alone. s1_controller.py,
+s2_controller.py and s3_controller.py run it for a single switch.
+
+    python3 controllers/controller.py                 # every switch in topology.json
+    python3 controllers/controller.py --switch s1 s2
+"""
+import argparse
+import datetime
+import logging
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock
+from time import sleep
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+import rules
+import runtime_functions as rt
+import failure_detector
+import failover
+import keyed_workers
+import failover_trace
+import pdc_notify
+
+import grpc
+
+# Import P4Runtime lib from parent utils dir
+# this is the local path to the utils folder of the P4 tutorials;
+# change it to your own path
+sys.path.append('/home/p4/tutorials/utils')
+import p4runtime_lib.bmv2
+import p4runtime_lib.helper
+from p4runtime_lib.switch import ShutdownAllSwitchConnections
+from p4.v1 import p4runtime_pb2
+
+
+# net_report_t DigestEntry.Config. The switch sends a DigestList when max_list_size
+# reports are queued or max_timeout_ns after the first one, so reports of correlated
+# failures arrive (and are handled) together. ack_timeout_ns > 0 lets the switch
+# suppress reports identical to ones sent but not yet acknowledged.
+DIGEST_CONFIG = {'max_timeout_ns': 100000, 'max_list_size': 64, 'ack_timeout_ns': 0}
+
+
+def reroutes_of(actions):
+    return tuple(action for action in actions if isinstance(action, failover.Reroute))
+
+
+class Controller:
+    """Runs the failover plan of one switch against its P4Runtime connection."""
+
+    def __init__(self, plan, p4info_helper, switch_conn, workers=4, trace=None):
+        """
+        :param plan: The switch's failover.FailoverPlan.
+        :param p4info_helper: The P4Info helper.
+        :param switch_conn: The switch connection.
+        :param workers: Threads that carry out failover actions (see keyed_workers).
+        :param trace: failover_trace.TraceLog the failover stages are recorded in, or None.
+        """
+        self.plan = plan
+        self.engine = failover.FailoverEngine(plan)
+        self.p4info_helper = p4info_helper
+        self.switch_conn = switch_conn
+        self.name = plan.switch.name
+        # Decisions on digests from the switch and reports from the heartbeat monitor are made one
+        # at a time; their actions run on the workers, in order per PDC.
+        self.lock = Lock()
+        self.workers = keyed_workers.KeyedWorkerPool(workers, name=f"{self.name}-actions")
+        self.sockets = {}
+        self.writes = rt.PrecompiledWrites(switch_conn)
+        self.frames = {}
+        self.trace = trace
+
+    def build_reroute_entry(self, action):
+        failed, backup = action.failed, action.backup
+        if backup is None:
+            # The PDC is back: its static forwarding entry
+            return self.p4info_helper.buildTableEntry(
+                table_name="MyIngress.ipv4_lpm",
+                match_fields={"hdr.ipv4.dstAddr": (failed.ip, 32)},
+                action_name="MyIngress.ipv4_forward",
+                action_params={"dstAddr": failed.mac, "port": action.egress_port}
+            )
+        return self.p4info_helper.buildTableEntry(
+            table_name="MyIngress.ipv4_lpm",
+            match_fields={"hdr.ipv4.dstAddr": (failed.ip, 32)},
+            action_name="MyIngress.ipv4_nat_forward",
+            action_params={
+                "dstAddr": backup.mac,
+                "port": action.egress_port,
+                "new_dst_ip": backup.ip
+            }
+        )
+
+    def recover_states(self, installed):
+        """
+        Local PDC states implied by the entries installed on the switch: a
+        local PDC whose IP is NATed to one of its backups was rerouted there.
+        """
+        nat_forward = self.p4info_helper.get_actions_id("MyIngress.ipv4_nat_forward")
+        new_dst_ip = self.p4info_helper.get_action_param("MyIngress.ipv4_nat_forward", "new_dst_ip").id
+        table_id = self.p4info_helper.get_tables_id("MyIngress.ipv4_lpm")
+        states = {}
+        for entry in installed:
+            if entry.table_id != table_id or entry.action.action.action_id != nat_forward or not entry.match:
+                continue
+            failed = self.plan.by_ip.get(int.from_bytes(entry.match[0].lpm.value, 'big'))
+            params = {param.param_id: param.value for param in entry.action.action.params}
+            backup = self.plan.by_ip.get(int.from_bytes(params.get(new_dst_ip, b''), 'big'))
+            if failed and backup and failed.name in self.plan.local_index and backup.name in self.plan.backups[failed.name]:
+                states[failed.name] = backup.name
+        return states
+
+    def desired_entries(self, static_entries):
+        """The static entries with the reroutes of the current states in place of the PDCs' own entries."""
+        entries = {rt.entryKey(entry): entry for entry in static_entries}
+        for name, state in self.engine.states().items():
+            if state not in (failover.UP, failover.DOWN):
+                failed, backup = self.plan.pdcs[name], self.plan.pdcs[state]
+                entry = self.build_reroute_entry(failover.Reroute(failed, backup, self.plan.egress_port(backup)))
+                entries[rt.entryKey(entry)] = entry
+        return list(entries.values())
+
+    def build_notify_frame(self, action):
+        return pdc_notify.build_frame(
+            self.plan.switch.mac, self.plan.switch.ip,
+            pdc_notify.pack_net_hdr(action.pdc.pmu_count, action.pdc.ip_value, action.rtype),
+            dst_ip=action.switch.ip)
+
+    def precompile(self):
+        """
+        Builds the write for every single reroute and for every decision
+        from the initial state, and the frame for every notification the
+        plan can ask for. Writes of other reroute combinations are built on
+        first use and kept (see reroute).
+        """
+        candidates = [(action,) for action in self.plan.actions(failover.Reroute)]
+        # One write per decision: all of its reroutes go out in a single WriteRequest.
+        for pdc in self.plan.pdcs.values():
+            for rtype in failover.REPORT_TYPES:
+                actions, _ = self.plan.decide(pdc.ip_value, rtype, self.plan.initial_state)
+                candidates.append(reroutes_of(actions))
+        for reroutes in dict.fromkeys(candidates):
+            if reroutes:
+                self.writes.add(reroutes, [self.build_reroute_entry(action) for action in reroutes])
+        for action in self.plan.actions(failover.Notify):
+            self.frames[action] = self.build_notify_frame(action)
+        print(f"Precompiled {len(self.writes)} failover writes and {len(self.frames)} notifications for {self.name}")
+
+    def open_ports(self):
+        """Opens a raw socket on every port towards another switch, for net_hdr notifications."""
+        for port in sorted(set(self.plan.next_hop_port.values())):
+            iface = f"{self.name}-eth{port}"
+            try:
+                sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+                sock.bind((iface, 0))
+                self.sockets[port] = sock
+            except OSError as e:
+                print(f"Warning: cannot send notifications on {iface}: {e}", file=sys.stderr)
+
+    def close(self):
+        self.workers.close()
+        print(f"{self.name} actions: {self.workers.summary()}")
+        if self.trace:
+            self.trace.close()
+        for sock in self.sockets.values():
+            sock.close()
+
+    def handle_digests(self):
+        print(f"Listening for digests on {self.name}...")
+        while True:
+            try:
+                digest = self.switch_conn.dispatcher.digest_queue.get()
+                arrival_time = datetime.datetime.now()
+
+                # Acknowledge the digest first, so the switch can send the next list right away
+                ack = p4runtime_pb2.StreamMessageRequest()
+                ack.digest_ack.digest_id = digest.digest_id
+                ack.digest_ack.list_id = digest.list_id
+                self.switch_conn.requests_stream.put(ack)
+
+                ts_sec = digest.timestamp / 1e9
+                print(f"{self.name}:", datetime.datetime.fromtimestamp(ts_sec))
+
+                self.process_digest(digest, arrival_time)
+
+            except grpc.RpcError:
+                print(f"gRPC Error. Disconnected from {self.name}.")
+                return
+            except Exception as e:
+                print(f"An error occurred in handle_digests for {self.name}: {e}")
+                return
+
+    def process_digest(self, digest_t, arrival_time):
+        """Handles every net_report_t in a digest list as one batch."""
+        reports = []
+        for data in digest_t.data:
+            members = data.struct.members
+            reports.append((int.from_bytes(members[0].bitstring, 'big'),
+                            int.from_bytes(members[1].bitstring, 'big'),
+                            int.from_bytes(members[2].bitstring, 'big')))
+        if self.trace:
+            received = int(arrival_time.timestamp() * 1e9)
+            for _, ip_value, rtype in reports:
+                self.trace.record(failover_trace.DIGEST_RECEIVED, ip_value, rtype, received)
+        self.report_batch(reports, arrival_time)
+
+    def report(self, disconnected_pmus, ip_value, rtype, arrival_time):
+        """Looks up the decision for a report and carries out its actions."""
+        self.report_batch([(disconnected_pmus, ip_value, rtype)], arrival_time)
+
+    def report_batch(self, reports, arrival_time):
+        """
+        Runs a batch of (disconnected_pmus, ip_value, rtype) reports through
+        the engine in one decision pass and hands the merged actions to the
+        workers: all reroutes as one write, keyed by the PDCs they move, and
+        each notification keyed by the PDC it is about.
+        """
+        if self.trace:
+            for _, ip_value, rtype in reports:
+                self.trace.record(failover_trace.HANDLER_START, ip_value, rtype)
+        with self.lock:
+            actions = self.engine.handle_batch(reports)
+            if actions:
+                logging.info("%s: %d reports (%s) -> %d actions, states %s", self.name, len(reports),
+                             ', '.join(f"ip={socket.inet_ntoa(ip_value.to_bytes(4, 'big'))} rtype={rtype} "
+                                       f"pmus={pmus}" for pmus, ip_value, rtype in reports),
+                             len(actions), self.engine.states())
+            # Submitting under the lock keeps the per-PDC order of the decisions.
+            reroutes = reroutes_of(actions)
+            if reroutes:
+                self.workers.submit([action.failed.name for action in reroutes], self.reroute, reroutes, arrival_time)
+            for action in actions:
+                if isinstance(action, failover.Notify):
+                    self.workers.submit(action.pdc.name, self.notify, action)
+            if self.trace:
+                # Runs once every action above has finished: it shares all of their keys.
+                keys = [action.failed.name for action in reroutes] + [action.pdc.name for action in actions
+                                                                       if isinstance(action, failover.Notify)]
+                if keys:
+                    self.workers.submit(keys, self.trace_handled, reports)
+        if self.trace and not actions:
+            self.trace_handled(reports)
+
+    def trace_handled(self, reports):
+        for _, ip_value, rtype in reports:
+            self.trace.record(failover_trace.HANDLER_END, ip_value, rtype)
+
+    def reroute(self, reroutes, arrival_time):
+        """Points the failed PDCs' IPs at their backups, all in one WriteRequest."""
+        try:
+            if reroutes in self.writes:
+                self.writes.send(reroutes)
+                failed = []
+            else:
+                entries = [self.build_reroute_entry(action) for action in reroutes]
+                failed = rt.writeEntries(self.switch_conn, entries, p4runtime_pb2.Update.MODIFY)
+                rt.printWriteFailures(self.p4info_helper, self.switch_conn, failed)
+                if not failed:
+                    # Sent as one precompiled write the next time this combination comes up
+                    self.writes.add(reroutes, entries)
+        except grpc.RpcError as e:
+            rt.printGrpcErrorReport(e)
+            return
+
+        latency = (datetime.datetime.now() - arrival_time).total_seconds() * 1000
+        failed_ips = {entry.match[0].lpm.value for entry, _ in failed}
+        for action in reroutes:
+            if action.failed.ip_value.to_bytes(4, 'big') in failed_ips:
+                continue
+            if action.backup is None:
+                print(f"Restored Rule of {action.failed.name} (latency: {latency:.3f} ms)")
+                logging.info("%s: restored %s in %.3f ms", self.name, action.failed.name, latency)
+                continue
+            if self.trace:
+                self.trace.record(failover_trace.RULE_INSTALLED, action.failed.ip_value)
+            print(f"Installed Rule from {action.failed.name} to {action.backup.name} (latency: {latency:.3f} ms)")
+            logging.info("%s: rerouted %s to %s in %.3f ms", self.name, action.failed.name, action.backup.name,
+                         latency)
+
+    def notify(self, action):
+        """Sends a net_hdr request (rtype 0) or offer (rtype 1) to another switch."""
+        sock = self.sockets.get(action.egress_port)
+        if sock is None:
+            print(f"Cannot notify {action.switch.name}: port {action.egress_port} is not open", file=sys.stderr)
+            return
+        frame = self.frames.get(action)
+        sock.send(frame if frame is not None else self.build_notify_frame(action))
+        if self.trace:
+            self.trace.record(failover_trace.NOTIFY_SENT, action.pdc.ip_value, action.rtype)
+        kind = "offered" if action.rtype == failover.PDC_OFFER else "requested a backup for"
+        print(f"{self.name} {kind} {action.pdc.name} -> {action.switch.name}")
+
+    def report_pdc_failure(self, peer, reason):
+        """Runs a PDC failure found by the heartbeat monitor through the same decisions as a digest."""
+        if self.trace:
+            self.trace.record(failover_trace.HEARTBEAT_SUSPECTED, peer.ip_value)
+        print(f"{self.name}: PDC {peer.ip} failed ({reason}), rerouting its PMUs")
+        self.report(peer.pmu_count, peer.ip_value, failover.PDC_DOWN, datetime.datetime.now())
+
+    def report_pdc_recovery(self, peer):
+        """Points a PDC that sends heartbeats again back at itself, undoing its reroute."""
+        print(f"{self.name}: PDC {peer.ip} is back, restoring its forwarding")
+        self.report(peer.pmu_count, peer.ip_value, failover.PDC_UP, datetime.datetime.now())
+
+
+def bring_up(plan, p4info_helper, bmv2_file_path, write_chunk=128, entry_cache=None,
+             digest_config=None, workers=4, trace_dir=None, proto_log='binary', reconcile=True):
+    """
+    Arbitration, pipeline push, static rules and digest registration for one
+    switch. Safe to run for several switches at once.
+
+    With reconcile, a switch that already runs this program (same pipeline
+    cookie) keeps it and its entries: the failover states are recovered
+    from the installed reroutes and only the difference to the desired
+    entries is written, so restarting the controller does not disturb
+    forwarding.
+
+    :param digest_config: net_report_t DigestEntry.Config fields (see DIGEST_CONFIG).
+    :param workers: Action worker threads of the switch's Controller.
+    :param trace_dir: Directory for the switch's failover trace file (None disables tracing).
+    :param proto_log: P4Runtime request log: 'binary' (asynchronous, see proto_log.py), 'text'
+        (p4runtime_lib's synchronous text dump, for debugging) or 'off'.
+    :param reconcile: Keep an identical pipeline and reconcile the entries instead of pushing and reinstalling.
+    :return: The switch's Controller, ready to start.
+    """
+    name = plan.switch.name
+    started = time.perf_counter()
+    # Create switch connection object
+    switch_conn = rt.SharedConfigSwitchConnection(
+        name=name,
+        address=plan.switch.address,
+        device_id=plan.switch.device_id,
+        proto_dump_file=os.path.join(project_root, 'logs', f'{name}-p4runtime-requests.'
+                                     + ('txt' if proto_log == 'text' else 'bin')),
+        log_mode=proto_log)
+
+    # Establish master arbitration
+    election_id = (0, plan.switch.device_id + 1)
+    switch_conn.MasterArbitrationUpdate(election_id=election_id)
+
+    # Install the P4 program on the switch, unless it already runs it
+    cookie = rt.pipelineCookie(p4info_helper.p4info, bmv2_file_path)
+    keep_pipeline = reconcile and rt.getPipelineCookie(switch_conn) == cookie
+    if keep_pipeline:
+        print(f"{name} already runs this P4 program (cookie {cookie:#018x}); keeping its state")
+    else:
+        rt.setPipelineConfig(switch_conn, p4info_helper.p4info, bmv2_file_path, cookie)
+        print(f"Installed P4 Program using SetForwardingPipelineConfig on {name}")
+
+    trace = failover_trace.open_trace(trace_dir and os.path.join(trace_dir, f"trace-{name}.bin"), name)
+    controller = Controller(plan, p4info_helper, switch_conn, workers, trace)
+
+    if keep_pipeline:
+        # Reconcile the installed entries with the static rules plus the recovered reroutes
+        installed = rt.readTableEntries(switch_conn)
+        controller.engine.restore(controller.recover_states(installed))
+        desired = controller.desired_entries(
+            rt.buildRuleEntries(p4info_helper, getattr(rules, f"{name}_rules"), entry_cache))
+        (inserts, modifies, deletes), failed = rt.reconcileEntries(switch_conn, installed, desired, write_chunk)
+        rt.printWriteFailures(p4info_helper, switch_conn, failed)
+        print(f"Reconciled {len(installed)} installed entries on {name}: {inserts} inserted, {modifies} modified, "
+              f"{deletes} deleted; states {controller.engine.states()}")
+    else:
+        # Install the static rules
+        rt.writeRules(p4info_helper, switch_conn, getattr(rules, f"{name}_rules"), chunk_size=write_chunk,
+                      cache=entry_cache)
+        print(f"Installed rules on {name}.")
+
+    request = p4runtime_pb2.WriteRequest()
+    request.device_id = switch_conn.device_id
+    request.election_id.high = election_id[0]
+    request.election_id.low = election_id[1]
+    update = request.updates.add()
+    # A kept pipeline still has the previous controller's digest registration
+    update.type = p4runtime_pb2.Update.MODIFY if keep_pipeline else p4runtime_pb2.Update.INSERT
+    digest_entry = update.entity.digest_entry
+    digest_entry.digest_id = p4info_helper.get_digests_id("net_report_t")
+    for field, value in {**DIGEST_CONFIG, **(digest_config or {})}.items():
+        setattr(digest_entry.config, field, value)
+
+    print(f"Registering for digest 'net_report_t' on {name}...")
+    try:
+        switch_conn.client_stub.Write(request)
+    except grpc.RpcError:
+        if not keep_pipeline:
+            raise
+        # The previous controller never registered it
+        update.type = p4runtime_pb2.Update.INSERT
+        switch_conn.client_stub.Write(request)
+    print(f"Successfully registered for digest on {name}.")
+
+    controller.precompile()
+    controller.open_ports()
+    print(plan.describe())
+    print(f"{name} is up ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return controller
+
+
+def start(controller, heartbeat_options=None):
+    """Starts the digest thread and, if a heartbeat port is set, the heartbeat monitor of a switch."""
+    digest_thread = Thread(target=controller.handle_digests, name=f"{controller.name}-digests")
+    digest_thread.daemon = True # Allows main program to exit even if thread is running
+    digest_thread.start()
+
+    if heartbeat_options and heartbeat_options.get('listen_port'):
+        failure_detector.HeartbeatMonitor(on_failure=controller.report_pdc_failure,
+                                          on_recovery=controller.report_pdc_recovery, **heartbeat_options).start()
+        print(f"Watching PDC heartbeats for {controller.name} on "
+              f"{heartbeat_options['listen_ip']}:{heartbeat_options['listen_port']}")
+
+
+def main(plans, p4info_file_path, bmv2_file_path, heartbeat_options=None, write_chunk=128, digest_config=None, workers=4, metrics_interval=10.0, trace_dir=None, proto_log='binary',
+         reconcile=True):
+    """
+    Brings up every switch of plans concurrently, then runs their controllers
+    in this process until interrupted.
+
+    :param plans: FailoverPlans of the switches to control.
+    :param heartbeat_options: HeartbeatMonitor options; listen_port defaults to each switch's heartbeat port.
+    :param metrics_interval: Seconds between action worker metrics in the log (0 disables them).
+    """
+    # One P4Info index and one entry cache for all switches
+    p4info_helper = rt.IndexedP4InfoHelper(p4info_file_path)
+    entry_cache = {}
+    heartbeat_options = heartbeat_options or {}
+    controllers = []
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(plans), thread_name_prefix="bring-up") as pool:
+            futures = {plan.switch.name: pool.submit(bring_up, plan, p4info_helper, bmv2_file_path,
+                                                     write_chunk, entry_cache, digest_config, workers,
+                                                     trace_dir, proto_log, reconcile)
+                       for plan in plans}
+            for name, future in futures.items():
+                try:
+                    controllers.append(future.result())
+                except grpc.RpcError as e:
+                    print(f"Could not bring up {name}:")
+                    rt.printGrpcError(e)
+                except Exception as e:
+                    # One bad switch (e.g. a P4Info mismatch or an unwritable log file) must not stop the others
+                    print(f"Could not bring up {name}: {type(e).__name__}: {e}", file=sys.stderr)
+        print(f"{len(controllers)} of {len(plans)} switches up in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        for controller in controllers:
+            options = dict(heartbeat_options)
+            if options.get('listen_port') is None:
+                options['listen_port'] = controller.plan.switch.heartbeat_port
+            start(controller, options)
+
+        next_metrics = time.monotonic() + metrics_interval
+        while controllers:
+            sleep(1)
+            if metrics_interval and time.monotonic() >= next_metrics:
+                next_metrics += metrics_interval
+                for controller in controllers:
+                    logging.info("%s actions: %s", controller.name, controller.workers.summary())
+
+    except KeyboardInterrupt:
+        print(" Shutting down.")
+
+    for controller in controllers:
+        controller.close()
+    ShutdownAllSwitchConnections()
+
+
+def run_cli(switch_name=None):
+    """Parses the command line and runs the controller; switch_name fixes --switch (used by sN_controller.py)."""
+    parser = argparse.ArgumentParser(description='P4Runtime failover controller')
+    parser.add_argument('--switch', type=str, nargs='+', default=[switch_name] if switch_name else None,
+                        help='Switches to control, e.g. s1 s2 (default: every switch in the topology)')
+    parser.add_argument('--p4info', help='p4info proto in text format from p4c',
+                        type=str, action="store", required=False,
+                        default=os.path.join(project_root, 'build', 'basic.p4.p4info.txtpb'))
+    parser.add_argument('--bmv2-json', help='BMv2 JSON file from p4c',
+                        type=str, action="store", required=False,
+                        default=os.path.join(project_root, 'build', 'basic.json'))
+    parser.add_argument('--topology', type=str, default=os.path.join(project_root, 'topology.json'),
+                        help='Topology file the failover plan is derived from')
+    parser.add_argument('--pdc-config', type=str, default=os.path.join(project_root, 'pdc_config.json'),
+                        help='PDC configuration file')
+    parser.add_argument('--policy', type=str, default=os.path.join(project_root, 'failover_policy.json'),
+                        help='Failover policy: switches and backup PDCs per PDC')
+    parser.add_argument('--heartbeat-ip', type=str, default='0.0.0.0',
+                        help='Address to receive PDC heartbeats on')
+    parser.add_argument('--heartbeat-port', type=int, default=None,
+                        help='UDP port to receive PDC heartbeats on (default from the policy, 0 disables)')
+    parser.add_argument('--detector', type=str, choices=failure_detector.DETECTORS, default='phi',
+                        help='Failure detector: phi accrual or plain timeout')
+    parser.add_argument('--phi-threshold', type=float, default=8.0,
+                        help='Phi level at which a PDC is considered down. Lower detects sooner but mistakes '
+                             'scheduling jitter for failures more often; each false suspicion reroutes the '
+                             "PDC's PMUs until its heartbeats are back")
+    parser.add_argument('--min-std', type=float, default=0.025,
+                        help='Lower bound (s) on the learned heartbeat jitter of the phi detector; with the '
+                             'defaults a PDC is suspected after about 190 ms of silence')
+    parser.add_argument('--detection-timeout', type=float, default=0.25,
+                        help='Silence (s) after which a PDC is considered down with --detector timeout')
+    parser.add_argument('--max-silence', type=float, default=1.0,
+                        help='Silence (s) after which a PDC is always considered down')
+    parser.add_argument('--write-chunk', type=int, default=128,
+                        help='Maximum table entries per P4Runtime WriteRequest')
+    parser.add_argument('--digest-max-timeout-ns', type=int, default=DIGEST_CONFIG['max_timeout_ns'],
+                        help='Longest the switch holds a net_report_t before sending its digest list (0 = at once)')
+    parser.add_argument('--digest-max-list-size', type=int, default=DIGEST_CONFIG['max_list_size'],
+                        help='Most net_report_t per digest list (1 disables batching)')
+    parser.add_argument('--digest-ack-timeout-ns', type=int, default=DIGEST_CONFIG['ack_timeout_ns'],
+                        help='How long the switch suppresses repeats of unacknowledged reports')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Threads per switch that carry out failover actions, in order per PDC')
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        help='Seconds between action queue metrics in the log (0 disables them)')
+    parser.add_argument('--trace-dir', type=str, default=None,
+                        help='Record failover trace events in trace-<switch>.bin here (see trace_report.py)')
+    parser.add_argument('--proto-log', type=str, choices=rt.PROTO_LOG_MODES, default='binary',
+                        help='P4Runtime request log in logs/: binary and asynchronous (convert with proto_log.py), '
+                             'the synchronous text dump (debugging) or off')
+    parser.add_argument('--reconcile', action=argparse.BooleanOptionalAction, default=True,
+                        help='Keep a switch that already runs this P4 program and only write the entries that '
+                             'differ (--no-reconcile pushes the pipeline and reinstalls everything)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.p4info):
+        parser.print_help()
+        print("\np4info file not found: %s\nHave you run 'make'?" % args.p4info)
+        parser.exit(1)
+    if not os.path.exists(args.bmv2_json):
+        parser.print_help()
+        print("\nBMv2 JSON file not found: %s\nHave you run 'make'?" % args.bmv2_json)
+        parser.exit(1)
+
+    topology = failover.load_json(args.topology)
+    switches = args.switch or list(topology['switches'])
+    if args.heartbeat_port is not None and len(switches) > 1:
+        parser.error("--heartbeat-port needs a single --switch; each switch has its own port in the policy")
+    pdc_config, policy = failover.load_json(args.pdc_config), failover.load_json(args.policy)
+    plans = [failover.FailoverPlan(switch, topology, pdc_config, policy) for switch in switches]
+    logging.basicConfig(
+        filename=os.path.join(project_root, 'logs',
+                              f'{switches[0]}_controller.log' if len(switches) == 1 else 'controller.log'),
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    main(plans, args.p4info, args.bmv2_json,
+         heartbeat_options={'listen_ip': args.heartbeat_ip, 'listen_port': args.heartbeat_port,
+                            'detector': args.detector, 'threshold': args.phi_threshold,
+                            'timeout': args.detection_timeout, 'max_silence': args.max_silence,
+                            'min_std': args.min_std},
+         write_chunk=args.write_chunk,
+         digest_config={'max_timeout_ns': args.digest_max_timeout_ns, 'max_list_size': args.digest_max_list_size,
+                        'ack_timeout_ns': args.digest_ack_timeout_ns},
+         workers=args.workers, metrics_interval=args.metrics_interval, trace_dir=args.trace_dir,
+         proto_log=args.proto_log, reconcile=args.reconcile)
+
+if __name__ == '__main__':
+    run_cli()
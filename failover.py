@@ -0,0 +1,321 @@
+"""
+Data-driven PDC failover decisions for the switch controllers.
+
+Everything a controller needs to know is derived from three files:
+
+    topology.json          which switch and port every PDC hangs off, and
+                           the switch-to-switch links
+    pdc_config.json        each PDC's IP, MAC and PMU count
+    failover_policy.json   per switch: P4Runtime address, device id and
+                           heartbeat port; per PDC: the ordered list of
+                           PDCs that may take over its PMUs
+
+Switches talk to each other with net_hdr packets (see pdc_notify):
+
+    rtype 0, ip = PDC X   "PDC X is down" - from X itself to its switch,
+                          or from X's switch asking the others for help
+    rtype 1, ip = PDC Y   "PDC Y can take over" - the answer, sent back
+                          to the switch that asked
+
+A third report type, PDC_UP ("local PDC X is sending heartbeats again"),
+comes only from the controller's heartbeat monitor and never goes on the
+wire: the PDC's IP is pointed back at the PDC itself and it is UP again,
+so a false suspicion does not move its PMUs away for good.
+
+A switch tracks each of its local PDCs as UP, DOWN (down and nobody took
+over yet) or the name of the backup it was rerouted to; when that backup
+fails in turn, the PDC is rerouted again. FailoverPlan decides, for a PDC
+IP, a report type and the current local states, the actions to take and
+the next local state, and memoizes the decision: the first report of a
+kind in a given state is worked out once, every later one is a dict
+lookup. Only states that actually occur are ever computed, so the plan
+stays small as PDCs are added (the full state space grows exponentially
+with the number of local PDCs). Repeated reports simply map to no actions. A digest list with several reports is handled as
+one batch: repeats are dropped and the actions of all reports are merged,
+so all reroutes go out in one write.
+
+Switch s<N> is assumed to use IP 10.0.0.<N> and MAC 00:00:00:00:01:<N>
+(as in rules.py) unless the policy says otherwise.
+"""
+import ipaddress
+import json
+from collections import deque, namedtuple
+
+# Local PDC states; a rerouted PDC's state is the name of the PDC serving it.
+UP, DOWN = 'up', 'down'
+PDC_DOWN, PDC_OFFER = 0, 1
+# Reported by the heartbeat monitor only; never sent as a net_hdr rtype.
+PDC_UP = 2
+REPORT_TYPES = (PDC_DOWN, PDC_OFFER, PDC_UP)
+
+Pdc = namedtuple('Pdc', 'name ip ip_value mac pmu_count switch port')
+Switch = namedtuple('Switch', 'name ip mac address device_id heartbeat_port')
+
+# Install a NAT rule so traffic for failed's IP goes to backup, out of egress_port;
+# with backup None, restore the plain forwarding entry of failed (it is back).
+Reroute = namedtuple('Reroute', 'failed backup egress_port')
+# Send a net_hdr packet to another switch: rtype 0 asks for help with pdc, rtype 1 offers pdc.
+Notify = namedtuple('Notify', 'pdc rtype switch egress_port')
+
+
+def load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def switch_number(name):
+    return int(''.join(ch for ch in name if ch.isdigit()))
+
+
+def split_port(endpoint):
+    """'s1-p3' -> ('s1', 3); a host name -> (name, None)."""
+    if '-p' in endpoint:
+        node, port = endpoint.rsplit('-p', 1)
+        return node, int(port)
+    return endpoint, None
+
+
+class FailoverPlan:
+    """Failover decisions of one switch, derived from topology, PDC config and policy."""
+
+    def __init__(self, switch, topology, pdc_config, policy):
+        """
+        :param switch: Name of the switch this controller runs, e.g. 's1'.
+        :param topology: Parsed topology.json.
+        :param pdc_config: Parsed pdc_config.json.
+        :param policy: Parsed failover_policy.json.
+        """
+        self.switches = {}
+        for name, settings in policy['switches'].items():
+            n = switch_number(name)
+            self.switches[name] = Switch(name, settings.get('ip', f"10.0.0.{n}"),
+                                         settings.get('mac', f"00:00:00:00:01:{n:02x}"),
+                                         settings['address'], settings['device_id'],
+                                         settings.get('heartbeat_port'))
+        if switch not in self.switches:
+            raise ValueError(f"switch {switch!r} is not in the failover policy")
+        self.switch = self.switches[switch]
+
+        # Host attachments and switch adjacency from the link list.
+        attached = {}
+        adjacency = {name: {} for name in topology['switches']}
+        for a, b in topology['links']:
+            (node_a, port_a), (node_b, port_b) = split_port(a), split_port(b)
+            if port_a is not None and port_b is not None:
+                adjacency[node_a][node_b] = port_a
+                adjacency[node_b][node_a] = port_b
+            elif port_b is not None:
+                attached[node_a] = (node_b, port_b)
+            elif port_a is not None:
+                attached[node_b] = (node_a, port_a)
+        self.next_hop_port = self._next_hops(adjacency, switch)
+
+        self.pdcs = {}
+        for name, settings in pdc_config.items():
+            if name not in attached:
+                continue  # e.g. the 'default' entry
+            pdc_switch, port = attached[name]
+            ip = settings['listen_ip']
+            self.pdcs[name] = Pdc(name, ip, int(ipaddress.ip_address(ip)), settings['mac'],
+                                  settings['pmu'], pdc_switch, port)
+        self.by_ip = {pdc.ip_value: pdc for pdc in self.pdcs.values()}
+        self.backups = {name: [b for b in policy['backups'].get(name, []) if b in self.pdcs] for name in self.pdcs}
+
+        self.local = sorted(name for name, pdc in self.pdcs.items() if pdc.switch == switch)
+        self.local_index = {name: i for i, name in enumerate(self.local)}
+        self.initial_state = tuple(UP for _ in self.local)
+
+        # (ip_value, rtype, state) -> (actions, next state), filled in by decide()
+        self.decisions = {}
+
+    @classmethod
+    def from_files(cls, switch, topology_file, pdc_config_file, policy_file):
+        return cls(switch, load_json(topology_file), load_json(pdc_config_file), load_json(policy_file))
+
+    @staticmethod
+    def _next_hops(adjacency, source):
+        """Local egress port towards every other switch (breadth-first shortest path)."""
+        ports = {}
+        queue = deque()
+        for neighbour, port in adjacency[source].items():
+            ports[neighbour] = port
+            queue.append(neighbour)
+        while queue:
+            node = queue.popleft()
+            for neighbour in adjacency[node]:
+                if neighbour != source and neighbour not in ports:
+                    ports[neighbour] = ports[node]
+                    queue.append(neighbour)
+        return ports
+
+    def egress_port(self, pdc):
+        """Port of this switch that leads to pdc."""
+        if pdc.switch == self.switch.name:
+            return pdc.port
+        return self.next_hop_port[pdc.switch]
+
+    def decide(self, ip_value, rtype, state):
+        """
+        Actions and next local state for a report in state, memoized.
+
+        :return: (actions, next state), or None for an unknown PDC or report type.
+        """
+        key = (ip_value, rtype, state)
+        decision = self.decisions.get(key)
+        if decision is None:
+            pdc = self.by_ip.get(ip_value)
+            if pdc is None or rtype not in REPORT_TYPES:
+                return None
+            decision = self.decisions[key] = self._decide(pdc, rtype, state)
+        return decision
+
+    def _decide(self, pdc, rtype, state):
+        """Actions and next local state for a report about pdc."""
+        state = list(state)
+        actions = []
+        if rtype == PDC_DOWN:
+            if pdc.name in self.local_index:
+                i = self.local_index[pdc.name]
+                if state[i] != UP:
+                    return (), tuple(state)
+                state[i] = DOWN
+            # Local PDCs that were rerouted to the failed PDC need a new backup as well.
+            orphaned = [name for name in self.local if state[self.local_index[name]] == pdc.name]
+            for name in orphaned:
+                state[self.local_index[name]] = DOWN
+            waiting = ([pdc.name] if pdc.name in self.local_index else []) + orphaned
+            for name in waiting:
+                actions.extend(self._serve_locally_or_ask(name, state))
+            if pdc.name not in self.local_index:
+                # Offer the other switch our first up PDC its policy allows.
+                for backup in self.backups[pdc.name]:
+                    if backup in self.local_index and state[self.local_index[backup]] == UP:
+                        actions.append(Notify(self.pdcs[backup], PDC_OFFER, self.switches[pdc.switch],
+                                              self.next_hop_port[pdc.switch]))
+                        break
+        elif rtype == PDC_UP:
+            if pdc.name in self.local_index and state[self.local_index[pdc.name]] != UP:
+                state[self.local_index[pdc.name]] = UP
+                actions.append(Reroute(pdc, None, pdc.port))
+        elif pdc.name not in self.local_index:
+            # An offer from another switch: the first acceptable offer serves each waiting PDC.
+            for name in self.local:
+                i = self.local_index[name]
+                if state[i] == DOWN and pdc.name in self.backups[name]:
+                    actions.append(Reroute(self.pdcs[name], pdc, self.egress_port(pdc)))
+                    state[i] = pdc.name
+        return tuple(actions), tuple(state)
+
+    def _serve_locally_or_ask(self, name, state):
+        """Reroutes local PDC name to an up local backup, or asks the switches hosting its backups."""
+        for backup in self.backups[name]:
+            if backup in self.local_index and state[self.local_index[backup]] == UP:
+                state[self.local_index[name]] = backup
+                return [Reroute(self.pdcs[name], self.pdcs[backup], self.egress_port(self.pdcs[backup]))]
+        return [Notify(self.pdcs[name], PDC_DOWN, self.switches[switch], self.next_hop_port[switch])
+                for switch in dict.fromkeys(self.pdcs[b].switch for b in self.backups[name])
+                if switch != self.switch.name]
+
+    def actions(self, kind):
+        """Every distinct action of type kind (Reroute or Notify) any decision can produce."""
+        if kind is Reroute:
+            actions = [Reroute(self.pdcs[name], self.pdcs[backup], self.egress_port(self.pdcs[backup]))
+                       for name in self.local for backup in self.backups[name]]
+            actions.extend(Reroute(self.pdcs[name], None, self.pdcs[name].port) for name in self.local)
+            return actions
+        actions = []
+        for pdc in self.pdcs.values():
+            if pdc.name in self.local_index:
+                # Requests for help with a local PDC (see _serve_locally_or_ask)
+                actions.extend(Notify(pdc, PDC_DOWN, self.switches[switch], self.next_hop_port[switch])
+                               for switch in dict.fromkeys(self.pdcs[b].switch for b in self.backups[pdc.name])
+                               if switch != self.switch.name)
+            else:
+                # Offers of a local backup to the switch of a remote PDC
+                actions.extend(Notify(self.pdcs[backup], PDC_OFFER, self.switches[pdc.switch],
+                                      self.next_hop_port[pdc.switch])
+                               for backup in self.backups[pdc.name] if backup in self.local_index)
+        return list(dict.fromkeys(actions))
+
+    def describe(self):
+        lines = [f"{self.switch.name}: local PDCs {', '.join(self.local) or 'none'}, "
+                 f"{len(self.decisions)} decisions computed"]
+        for name in self.local:
+            lines.append(f"  {name} -> {', '.join(self.backups[name]) or 'no backups'}")
+        return '\n'.join(lines)
+
+
+def coalesce(reports):
+    """
+    Drops repeated reports from a batch of (disconnected_pmus, ip_value, rtype),
+    keeping the first report of each (ip_value, rtype) and the batch order.
+    """
+    first = {}
+    for report in reports:
+        first.setdefault(report[1:], report)
+    return list(first.values())
+
+
+def merge_actions(actions):
+    """
+    Actions of several decisions as one pass: the last reroute of every
+    failed PDC (earlier ones are overridden anyway) followed by every
+    distinct notification.
+    """
+    reroutes = {}
+    for action in actions:
+        if isinstance(action, Reroute):
+            reroutes.pop(action.failed.name, None)
+            reroutes[action.failed.name] = action
+    return tuple(reroutes.values()) + tuple(dict.fromkeys(a for a in actions if isinstance(a, Notify)))
+
+
+class FailoverEngine:
+    """Current local PDC states of one switch plus the plan that drives them."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.state = plan.initial_state
+
+    def handle(self, ip_value, rtype):
+        """
+        Applies a net_report_t (from a digest or the heartbeat monitor) and
+        returns the actions to carry out. Unknown PDCs give no actions.
+        """
+        decision = self.plan.decide(ip_value, rtype, self.state)
+        if decision is None:
+            return ()
+        actions, self.state = decision
+        return actions
+
+    def handle_batch(self, reports):
+        """
+        Applies a batch of (disconnected_pmus, ip_value, rtype) reports in
+        order, after dropping repeats, and returns the merged actions of all
+        of them (see merge_actions).
+        """
+        actions = []
+        for _, ip_value, rtype in coalesce(reports):
+            actions.extend(self.handle(ip_value, rtype))
+        # Requests for help that a later report of the batch already answered are not sent.
+        states = self.states()
+        return merge_actions([action for action in actions
+                              if not (isinstance(action, Notify) and action.rtype == PDC_DOWN
+                                      and states.get(action.pdc.name, DOWN) != DOWN)])
+
+    def restore(self, states):
+        """
+        Sets the local states, e.g. recovered from the switch's tables after a
+        controller restart. Local PDCs missing from states are UP.
+
+        :param states: {local PDC name: UP, DOWN or the name of the backup serving it}.
+        :raises ValueError: If a state is not possible under the plan.
+        """
+        state = tuple(states.get(name, UP) for name in self.plan.local)
+        for name, value in zip(self.plan.local, state):
+            if value not in (UP, DOWN) and value not in self.plan.backups[name]:
+                raise ValueError(f"{value!r} is not a state of {name} (backups: {self.plan.backups[name]})")
+        self.state = state
+
+    def states(self):
+        return dict(zip(self.plan.local, self.state))
@@ -0,0 +1,170 @@
+"""
+Failover trace log: timestamps of every stage of a PDC failover, from all
+processes involved, for measuring end-to-end failover latency.
+
+Each process (PDC, controller) writes its own binary trace file: a 20-byte
+header with the node name, then one 16-byte record per event:
+
+    timestamp   u64  nanoseconds since the epoch (time.time_ns())
+    key         u32  correlation key: the failed PDC's IPv4 address
+    stage       u8   see STAGES
+    extra       u8   stage-specific (e.g. the net_hdr rtype)
+    pad         u16
+
+The switch's net_report_t digest has no room for a correlation id, so
+events are correlated by the failed PDC's IP, which every stage knows
+(the shutdown notification, the digest, the request sent to other
+switches and the reroute all carry it), plus time: trace_report.py groups
+the events of one key into incidents. The backup PDC cannot tell which
+PDC a rerouted PMU belonged to, so it records the first row from every
+new source that is not one of its own PMUs (see pmu_homes) under the
+source's IP; a source that has been silent for SOURCE_GAP seconds counts
+as new again, so a PMU that fails over to the same backup a second time is
+traced again. trace_report.py matches the first rows to an incident by the
+PMUs' home PDCs. Timestamps from different hosts are only comparable with
+synchronised clocks (one machine under Mininet); the switch's own digest
+timestamp is on a different clock altogether and is not recorded.
+
+record() only appends to an in-memory buffer; a background thread writes
+the buffer out every flush_interval seconds and on close().
+"""
+import ipaddress
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+HEADER = struct.Struct('!4sB15s')
+TRACE_MAGIC = b'FOTR'
+TRACE_VERSION = 1
+RECORD = struct.Struct('!QIBBH')
+
+PDC_NOTIFY_SENT = 1        # PDC sent its shutdown notification (node: the PDC)
+HEARTBEAT_SUSPECTED = 2    # controller's failure detector suspected the PDC
+# 3 was the switch's digest timestamp, which is not on the epoch clock; it is no longer recorded.
+DIGEST_RECEIVED = 4        # controller dequeued the digest, extra = rtype
+HANDLER_START = 5          # controller started deciding on the report
+HANDLER_END = 6            # controller finished the report's writes and notifications
+NOTIFY_SENT = 7            # controller sent a net_hdr request/offer to another switch, extra = rtype
+RULE_INSTALLED = 8         # reroute write returned
+FIRST_ROW = 9              # first row from a new source stored (key: the source's IP)
+
+# Seconds a source must have been silent before its next row is recorded as a FIRST_ROW again;
+# longer than any PMU reporting interval.
+SOURCE_GAP = 10.0
+
+STAGES = {
+    PDC_NOTIFY_SENT: 'pdc_notify_sent',
+    HEARTBEAT_SUSPECTED: 'heartbeat_suspected',
+    DIGEST_RECEIVED: 'digest_received',
+    HANDLER_START: 'handler_start',
+    HANDLER_END: 'handler_end',
+    NOTIFY_SENT: 'notify_sent',
+    RULE_INSTALLED: 'rule_installed',
+    FIRST_ROW: 'first_row',
+}
+
+
+def ip_key(ip):
+    """Correlation key of an IPv4 address given as a string or an int."""
+    return ip if isinstance(ip, int) else int(ipaddress.ip_address(ip))
+
+
+def pmu_homes(pmu_config_file, topology_file):
+    """{PMU IP: IP of the PDC it reports to} (as strings) from pmu_config.json and topology.json."""
+    with open(pmu_config_file) as f:
+        pmu_config = json.load(f)
+    with open(topology_file) as f:
+        hosts = json.load(f)['hosts']
+    return {hosts[name]['ip'].split('/')[0]: settings['pdc_ip']
+            for name, settings in pmu_config.items() if name in hosts and 'pdc_ip' in settings}
+
+
+class TraceLog:
+    """Buffered writer of one process's trace file."""
+
+    def __init__(self, path, node, flush_interval=0.5):
+        """
+        :param path: Trace file; records are appended to it.
+        :param node: Name of this process in the trace (e.g. 'pdc1', 's1'), at most 15 bytes.
+        :param flush_interval: Seconds between writes of the buffered records.
+        """
+        self.path = path
+        self.node = node
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, node.encode()[:15]))
+            self.file.flush()
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+        self.records = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, stage, key, extra=0, timestamp_ns=None):
+        """
+        Appends an event to the buffer.
+
+        :param stage: One of the STAGES constants.
+        :param key: The failed PDC's IP as an int (see ip_key).
+        :param extra: Stage-specific byte.
+        :param timestamp_ns: Event time in nanoseconds since the epoch (defaults to now).
+        """
+        record = RECORD.pack(time.time_ns() if timestamp_ns is None else timestamp_ns, key, stage, extra, 0)
+        with self.lock:
+            self.buffer += record
+            self.records += 1
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            data, self.buffer = self.buffer, bytearray()
+        if data:
+            self.file.write(data)
+            self.file.flush()
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join(timeout=1.0)
+        self.flush()
+        self.file.close()
+
+
+def open_trace(path, node, **options):
+    """Returns a TraceLog, or None if path is None or (with a warning) cannot be opened."""
+    if not path:
+        return None
+    try:
+        return TraceLog(path, node, **options)
+    except OSError as e:
+        print(f"Warning: cannot open trace file {path} ({e}); tracing is disabled.", file=sys.stderr)
+        return None
+
+
+def read_trace(path):
+    """
+    Reads a trace file.
+
+    :return: (node, [(timestamp_ns, key, stage, extra), ...]) in file order.
+    :raises ValueError: If the file is not a trace file.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: not a trace file")
+    magic, version, node = HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError(f"{path}: not a version {TRACE_VERSION} trace file")
+    end = HEADER.size + (len(data) - HEADER.size) // RECORD.size * RECORD.size
+    events = [record[:4] for record in RECORD.iter_unpack(data[HEADER.size:end])]
+    return node.rstrip(b'\0').decode(), events
@@ -0,0 +1,205 @@
+"""
+Controller-side PDC failure detection from heartbeats.
+
+Each PDC sends a heartbeat every few tens of milliseconds (see
+pdc_notify.HeartbeatSender). HeartbeatMonitor receives them on a UDP port
+and keeps one detector per PDC:
+
+    timeout   a PDC is suspected once it has been silent for `timeout` seconds
+    phi       phi accrual (Hayashibara et al.): inter-arrival times are
+              modelled as a normal distribution learned from the last
+              `window` heartbeats, and the PDC is suspected when
+              phi = -log10(P(a heartbeat is still coming)) exceeds `threshold`
+
+Either way a PDC silent for max_silence seconds is always suspected, so the
+detection time is bounded by max_silence + check_interval even when the
+learned distribution is wide. A heartbeat flagged as stopping (clean
+shutdown) is reported at once.
+
+Suspected PDCs are handed to on_failure(peer, reason) once, from the
+monitor thread; the controllers turn that into the same net_report_t digest
+the switch would have sent and run it through process__digest. A suspected
+PDC that sends heartbeats again is handed to on_recovery(peer), which the
+controllers use to undo its reroute, so a false suspicion (e.g. the PDC
+was descheduled for a while) costs a brief detour of its PMUs rather than
+losing them for good. min_std sets how much jitter is tolerated: with 50 ms
+heartbeats, phi 8 is reached after about 50 + 5.6 * max(std, min_std) ms of
+silence.
+"""
+import math
+import socket
+import threading
+import time
+from collections import deque
+
+import pdc_notify
+
+DETECTORS = ('phi', 'timeout')
+
+
+class Peer:
+    """Heartbeat history and state of one PDC."""
+
+    def __init__(self, ip_value, pmu_count, window):
+        self.ip_value = ip_value
+        self.pmu_count = pmu_count
+        self.intervals = deque(maxlen=window)
+        self.last_arrival = None
+        self.last_seq = None
+        self.heartbeats = 0
+        self.lost = 0
+        self.failed = False
+        self.failed_at = None
+
+    @property
+    def ip(self):
+        return socket.inet_ntoa(self.ip_value.to_bytes(4, 'big'))
+
+    def heartbeat(self, seq, now):
+        if self.last_arrival is not None:
+            self.intervals.append(now - self.last_arrival)
+        if self.last_seq is not None and seq > self.last_seq + 1:
+            self.lost += seq - self.last_seq - 1
+        self.last_arrival = now
+        self.last_seq = seq
+        self.heartbeats += 1
+
+    def phi(self, now, min_std, default_interval):
+        """Suspicion level after the current silence (0 = none)."""
+        silence = now - self.last_arrival
+        if self.intervals:
+            mean = sum(self.intervals) / len(self.intervals)
+            variance = sum((x - mean) ** 2 for x in self.intervals) / len(self.intervals)
+        else:
+            mean, variance = default_interval, 0.0
+        std = max(math.sqrt(variance), min_std)
+        # P(interval > silence) for a normal distribution; clamp to keep log10 finite.
+        p_later = 0.5 * math.erfc((silence - mean) / (std * math.sqrt(2)))
+        return -math.log10(max(p_later, 1e-300))
+
+
+class HeartbeatMonitor:
+    """Receives PDC heartbeats and reports PDCs that stop sending them."""
+
+    def __init__(self, listen_ip, listen_port, on_failure, on_recovery=None, detector='phi', threshold=8.0,
+                 timeout=0.25, max_silence=1.0, window=100, min_std=0.025, default_interval=0.05,
+                 check_interval=0.01):
+        """
+        :param listen_ip: Address to receive heartbeats on.
+        :param listen_port: UDP port to receive heartbeats on.
+        :param on_failure: Called as on_failure(peer, reason) when a PDC is suspected.
+        :param on_recovery: Called as on_recovery(peer) when a suspected PDC sends heartbeats again.
+        :param detector: 'phi' or 'timeout'.
+        :param threshold: Phi level at which a PDC is suspected.
+        :param timeout: Silence in seconds after which a PDC is suspected (timeout detector).
+        :param max_silence: Silence in seconds after which a PDC is always suspected.
+        :param window: Inter-arrival times kept per PDC for the phi detector.
+        :param min_std: Lower bound on the learned standard deviation (s), against jitter-free histories.
+        :param default_interval: Assumed heartbeat interval before two heartbeats have arrived.
+        :param check_interval: Seconds between detector checks.
+        """
+        if detector not in DETECTORS:
+            raise ValueError(f"unknown detector {detector!r}, expected one of {DETECTORS}")
+        self.on_failure = on_failure
+        self.on_recovery = on_recovery
+        self.detector = detector
+        self.threshold = threshold
+        self.timeout = timeout
+        self.max_silence = max_silence
+        self.window = window
+        self.min_std = min_std
+        self.default_interval = default_interval
+        self.check_interval = check_interval
+        self.peers = {}
+        self.invalid = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((listen_ip, listen_port))
+        self.sock.settimeout(check_interval)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="heartbeat-monitor", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(timeout=1.0)
+        self.sock.close()
+
+    def _run(self):
+        next_check = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                data = self.sock.recv(64)
+            except socket.timeout:
+                data = None
+            except OSError:
+                return
+            now = time.monotonic()
+            if data is not None:
+                self._receive(data, now)
+            if now >= next_check:
+                self.check(now)
+                next_check = now + self.check_interval
+
+    def _receive(self, data, now):
+        heartbeat = pdc_notify.decode_heartbeat(data)
+        if heartbeat is None:
+            self.invalid += 1
+            return
+        ip_value, pmu_count, seq, _, flags = heartbeat
+        peer = self.peers.get(ip_value)
+        if peer is None:
+            peer = self.peers[ip_value] = Peer(ip_value, pmu_count, self.window)
+            print(f"Heartbeats from PDC {peer.ip} ({pmu_count} PMUs)")
+        elif peer.last_seq is not None and seq < peer.last_seq:
+            # The PDC restarted; its old history says nothing about the new process.
+            peer.intervals.clear()
+            peer.last_arrival = None
+            peer.last_seq = None
+        peer.pmu_count = pmu_count
+        if flags & pdc_notify.HEARTBEAT_STOPPING:
+            peer.last_arrival = now
+            self._fail(peer, 'stopping', now)
+            return
+        peer.heartbeat(seq, now)
+        if peer.failed:
+            peer.failed = False
+            print(f"PDC {peer.ip} is sending heartbeats again")
+            if self.on_recovery:
+                self.on_recovery(peer)
+
+    def check(self, now=None):
+        """Runs the detector over every PDC that is not already suspected."""
+        now = time.monotonic() if now is None else now
+        for peer in list(self.peers.values()):
+            if peer.failed or peer.last_arrival is None:
+                continue
+            silence = now - peer.last_arrival
+            if silence >= self.max_silence:
+                self._fail(peer, f"silent for {silence * 1000:.0f} ms", now)
+            elif self.detector == 'timeout':
+                if silence >= self.timeout:
+                    self._fail(peer, f"silent for {silence * 1000:.0f} ms", now)
+            else:
+                phi = peer.phi(now, self.min_std, self.default_interval)
+                if phi >= self.threshold:
+                    self._fail(peer, f"phi {phi:.1f} after {silence * 1000:.0f} ms of silence", now)
+
+    def _fail(self, peer, reason, now):
+        if peer.failed:
+            return
+        peer.failed = True
+        peer.failed_at = now
+        print(f"PDC {peer.ip} suspected down: {reason}")
+        try:
+            self.on_failure(peer, reason)
+        except Exception as e:
+            print(f"Error handling failure of PDC {peer.ip}: {e}")
+
+    def stats(self):
+        return ', '.join(f"{peer.ip}: {peer.heartbeats} heartbeats, {peer.lost} lost"
+                         + (" (down)" if peer.failed else "") for peer in self.peers.values())
@@ -1,40 +1,27 @@
 #!/bin/bash
 
-#For this script to work, you need to run chmod +x ./s1_controller.py, chmod +x ./s2_controller.py, and chmod +x ./s3_controller.py.
+# Starts a single controller process that controls every switch in topology.json (see controllers/controller.py).
+# Extra arguments are passed on, e.g. ./initialize_controllers.sh --switch s1 s2
 
-# Paths to the controller scripts
-S1_CONTROLLER="controllers/./s1_controller.py"
-S2_CONTROLLER="controllers/./s2_controller.py"
-S3_CONTROLLER="controllers/./s3_controller.py"
+CONTROLLER="controllers/controller.py"
 
-# Function to start a controller in the background
-start_controller() {
-    local controller=$1
-    echo "Starting $controller..."
-    python3 "$controller" &
-    echo "$controller started with PID $!"
-}
-
-# Function to stop all controllers
+# Function to stop the controller
 stop_controllers() {
-    echo "Stopping all controllers..."
-    pkill -f s1_controller.py
-    pkill -f s2_controller.py
-    pkill -f s3_controller.py
-    echo "All controllers stopped."
+    echo "Stopping the controller..."
+    kill -INT "$CONTROLLER_PID" 2>/dev/null
+    wait "$CONTROLLER_PID"
+    echo "Controller stopped."
     exit 0
 }
 
-# Trap Ctrl+C (SIGINT) to stop controllers gracefully
+# Trap Ctrl+C (SIGINT) to stop the controller gracefully
 trap stop_controllers SIGINT
 
-# Start all controllers
-start_controller "$S1_CONTROLLER"
-start_controller "$S2_CONTROLLER"
-start_controller "$S3_CONTROLLER"
+echo "Starting $CONTROLLER..."
+python3 "$CONTROLLER" "$@" &
+CONTROLLER_PID=$!
+echo "$CONTROLLER started with PID $CONTROLLER_PID"
 
 # Wait indefinitely to keep the script running
-echo "All controllers started. Press Ctrl+C to stop."
-while true; do
-    sleep 1
-done
+echo "Controller started. Press Ctrl+C to stop."
+wait "$CONTROLLER_PID"
@@ -0,0 +1,129 @@
+"""
+A worker pool that keeps tasks with a common key in order.
+
+Every task carries one or more keys (for the controllers: the PDCs it
+touches). A task only starts once every earlier task sharing one of its
+keys has finished; tasks without a common key run concurrently on the
+worker threads. So a slow reroute of one PDC never holds up the handling
+of an unrelated one, while two updates of the same PDC can never overtake
+each other.
+
+The pool keeps simple metrics: tasks submitted, completed and failed, the
+current and highest number of waiting tasks, and histograms (milliseconds)
+of the time tasks wait before they start and of how long they run.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+from pdc_telemetry import Histogram
+
+# Upper bucket bounds in milliseconds; the last bucket counts everything above.
+TASK_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+
+class Task:
+    __slots__ = ('keys', 'fn', 'args', 'submitted')
+
+    def __init__(self, keys, fn, args):
+        self.keys = keys
+        self.fn = fn
+        self.args = args
+        self.submitted = time.perf_counter()
+
+
+class KeyedWorkerPool:
+    """Runs submitted functions on worker threads, in order per key."""
+
+    def __init__(self, workers=4, name="worker"):
+        """
+        :param workers: Number of worker threads.
+        :param name: Prefix of the worker thread names.
+        """
+        self.lock = threading.Lock()
+        # Waiting and running tasks per key, oldest first; a task is ready when it heads all its keys.
+        self.pending = {}
+        self.ready = queue.Queue()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.wait_ms = Histogram(TASK_BOUNDS_MS)
+        self.service_ms = Histogram(TASK_BOUNDS_MS)
+        self.threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                        for i in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, keys, fn, *args):
+        """
+        Queues fn(*args) behind every earlier task that shares one of keys.
+
+        :param keys: Hashable keys of the task (a single key or an iterable of keys).
+        """
+        if isinstance(keys, (str, bytes)) or not hasattr(keys, '__iter__'):
+            keys = (keys,)
+        task = Task(tuple(dict.fromkeys(keys)), fn, args)
+        with self.lock:
+            for key in task.keys:
+                self.pending.setdefault(key, deque()).append(task)
+            self.submitted += 1
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+            if self._is_ready(task):
+                self.ready.put(task)
+
+    def _is_ready(self, task):
+        return all(self.pending[key][0] is task for key in task.keys)
+
+    def _run(self):
+        while True:
+            task = self.ready.get()
+            if task is None:
+                return
+            started = time.perf_counter()
+            try:
+                task.fn(*task.args)
+                failed = False
+            except Exception as e:
+                print(f"Error in {threading.current_thread().name}: {e}")
+                failed = True
+            finished = time.perf_counter()
+
+            with self.lock:
+                self.wait_ms.observe((started - task.submitted) * 1000.0)
+                self.service_ms.observe((finished - started) * 1000.0)
+                self.completed += 1
+                self.failed += failed
+                self.depth -= 1
+                for key in task.keys:
+                    waiting = self.pending[key]
+                    waiting.popleft()
+                    if not waiting:
+                        del self.pending[key]
+                    elif self._is_ready(waiting[0]):
+                        self.ready.put(waiting[0])
+
+    def close(self):
+        """Stops the workers once the tasks that are ready have run."""
+        for _ in self.threads:
+            self.ready.put(None)
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+
+    def stats(self):
+        with self.lock:
+            return {'submitted': self.submitted, 'completed': self.completed, 'failed': self.failed,
+                    'depth': self.depth, 'max_depth': self.max_depth,
+                    'wait_ms': self.wait_ms.to_dict(), 'service_ms': self.service_ms.to_dict()}
+
+    def summary(self):
+        """One-line human-readable summary."""
+        stats = self.stats()
+        service, wait = stats['service_ms'], stats['wait_ms']
+        return (f"{stats['completed']}/{stats['submitted']} tasks done ({stats['failed']} failed), "
+                f"depth {stats['depth']} (max {stats['max_depth']}), "
+                f"service mean {service['mean'] or 0:.3f} ms max {service['max'] or 0:.3f} ms, "
+                f"wait mean {wait['mean'] or 0:.3f} ms max {wait['max'] or 0:.3f} ms")
@@ -3,24 +3,26 @@ import socket
 import argparse
 import sys
 import json
-import csv
 import os
-from scapy.all import Ether, IP, Raw, sendp, Packet, BitField
-import ipaddress
 import signal
+import select
+import time
+import multiprocessing
+import pmu_frames
+import pdc_storage
+import pdc_concentrator
+import pdc_latest
+import pdc_telemetry
+import pdc_notify
+import failover_trace
+
+# Largest UDP payload; batched PMU frames carry several buses per datagram.
+MAX_DATAGRAM_SIZE = 65535
 
 # Turn SIGINT and SIGTERM into KeyboardInterrupt
 signal.signal(signal.SIGINT, lambda s, f: (_ for _ in ()).throw(KeyboardInterrupt))
 signal.signal(signal.SIGTERM, lambda s, f: (_ for _ in ()).throw(KeyboardInterrupt))
 
-class NetHdr(Packet):
-    name = "net_hdr"
-    fields_desc = [
-        BitField("disconnected_pmus", 0, 7),
-        BitField("ip_value", 0, 32),
-        BitField("rtype", 0, 1)
-    ]
-
 def load_config(config_file):
     try:
         with open(config_file, 'r') as f:
@@ -32,46 +34,352 @@ def load_config(config_file):
         print(f"Error: Could not decode JSON from '{config_file}'", file=sys.stderr)
         return None
 
-def pdc_recv(listen_ip, listen_port, csv_file, pmu_count, mac_address):
-    file_exists = os.path.isfile(csv_file)
-    if not file_exists:
-        with open(csv_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['busID', 'voltage', 'phaseAngle', 'timestamp'])
+def socket_drops(sock):
+    """
+    Returns the kernel's drop counter for a UDP socket from /proc/net/udp, or
+    None if it cannot be read (not Linux, or the socket is not listed).
+    """
+    inode = str(os.fstat(sock.fileno()).st_ino)
+    try:
+        with open('/proc/net/udp') as f:
+            next(f)  # header
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 13 and fields[9] == inode:
+                    return int(fields[12])
+    except OSError:
+        pass
+    return None
 
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server_socket.bind((listen_ip, listen_port))
-    print(f"PDC UDP server '{socket.gethostname()}' listening on {listen_ip}:{listen_port}, logging to {csv_file}")
+class UdpIngest:
+    """
+    Batched UDP receive loop over a preallocated buffer pool.
 
-    try:
-        with open(csv_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            #buffer = ""
-            while True:
-                data, addr = server_socket.recvfrom(1024)
-                buffer = data.decode('utf-8')
-                for line in buffer.split('\n'):
-                    parsed = parse_pmu_message(line)
-                    if parsed:
-                        writer.writerow(parsed)
-                        print(f"Stored data from {addr}: {parsed}")
-    except KeyboardInterrupt:
-        disconnected_pmus = pmu_count
-        ip_value = int(ipaddress.ip_address(listen_ip))  # 10.0.1.1 as int
-        rtype = 0
+    Each wake-up waits for the socket to become readable, then drains up to
+    batch_size datagrams with non-blocking recvfrom_into calls, one fixed
+    buffer per datagram (a recvmmsg-style batch without per-datagram
+    allocations). The returned memoryviews point into the pool and are only
+    valid until the next drain().
+    """
+
+    def __init__(self, sock, batch_size=64, buffer_size=MAX_DATAGRAM_SIZE, rcvbuf=None):
+        """
+        :param sock: A bound UDP socket; it is switched to non-blocking mode.
+        :param batch_size: Maximum datagrams read per wake-up.
+        :param buffer_size: Size of each receive buffer.
+        :param rcvbuf: Requested SO_RCVBUF in bytes (None keeps the system default).
+        """
+        self.sock = sock
+        if rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        sock.setblocking(False)
+        self.buffers = [bytearray(buffer_size) for _ in range(max(1, batch_size))]
+        self.views = [memoryview(buf) for buf in self.buffers]
+        self.poller = select.poll()
+        self.poller.register(sock, select.POLLIN)
+        self.datagrams = 0
+        self.bytes = 0
+        self.batches = 0
+        self.truncated = 0
+
+    def drain(self, timeout=None):
+        """
+        Waits up to timeout seconds (forever if None) for data and returns a
+        list of (memoryview, addr) pairs, empty if nothing arrived.
+        """
+        if not self.poller.poll(None if timeout is None else int(timeout * 1000)):
+            return []
+        batch = []
+        for buf, view in zip(self.buffers, self.views):
+            try:
+                nbytes, addr = self.sock.recvfrom_into(buf)
+            except BlockingIOError:
+                break
+            if nbytes == len(buf):
+                self.truncated += 1
+            batch.append((view[:nbytes], addr))
+            self.bytes += nbytes
+        self.datagrams += len(batch)
+        self.batches += 1
+        return batch
 
-        pkt = Ether(dst="ff:ff:ff:ff:ff:ff", src=mac_address) / \
-              IP(src=listen_ip, dst="10.0.0.1", proto=253) / \
-              NetHdr(disconnected_pmus=disconnected_pmus, ip_value=ip_value, rtype=rtype)
+    def stats(self):
+        drops = socket_drops(self.sock)
+        avg = self.datagrams / self.batches if self.batches else 0.0
+        return (f"{self.datagrams} datagrams, {self.bytes} bytes in {self.batches} batches "
+                f"(avg {avg:.1f}/wake-up), {self.truncated} truncated, "
+                f"kernel drops {drops if drops is not None else 'n/a'}, SO_RCVBUF {self.rcvbuf}")
 
-        sendp(pkt, iface="eth0", verbose=True)
-        print("Sent custom net_hdr packet from PDC.")
+def send_shutdown_notification(notifier, trace=None):
+    """Tells the switch this PDC is going away so it can redirect its PMUs."""
+    if notifier is None:
+        print("Shutdown notification not sent (no raw socket).", file=sys.stderr)
+        return
+    sent = notifier.send()
+    if trace:
+        trace.record(failover_trace.PDC_NOTIFY_SENT, notifier.ip_value, timestamp_ns=int(sent * 1e9))
+    print(f"Sent net_hdr shutdown notification at {sent:.6f} ({notifier.burst} copies on {notifier.iface}).")
+
+def pdc_recv(listen_ip, listen_port, csv_file, pmu_count, mac_address, rcvbuf=None, batch_size=64,
+             stats_interval=None, storage_options=None, storage='csv', archive_file=None,
+             concentrate=False, wait_window=0.1, ring_size=256, reuse_port=False, notify=True,
+             latest_depth=16, query_ip='127.0.0.1', query_port=None, telemetry_file=None,
+             telemetry_interval=10.0, notify_options=None, heartbeat_ip=None, heartbeat_port=None,
+             heartbeat_interval=0.05, trace_file=None, trace_node=None, home_sources=None):
+    """
+    :param listen_ip: The IP address to listen on.
+    :param listen_port: The UDP port to listen on.
+    :param csv_file: The CSV file received rows are appended to (csv storage).
+    :param pmu_count: Number of PMUs assigned to this PDC, reported when it shuts down.
+    :param mac_address: This PDC's MAC address, used for the shutdown notification.
+    :param rcvbuf: Requested socket receive buffer (SO_RCVBUF) in bytes.
+    :param batch_size: Maximum datagrams drained from the socket per wake-up.
+    :param stats_interval: Seconds between ingest statistics printouts (None disables them).
+    :param storage_options: Keyword arguments for pdc_storage.StorageWriter
+        (queue_size, flush_rows, flush_interval, overflow, quiet, summary_interval).
+    :param storage: Storage backend, 'csv' or 'columnar' (see pdc_storage).
+    :param archive_file: Columnar archive path; defaults to csv_file with a .pdca suffix.
+    :param concentrate: Time-align measurements from all pmu_count PMUs before storing them (see pdc_concentrator).
+    :param wait_window: Seconds the concentrator waits for missing PMUs in a time slot.
+    :param ring_size: Number of time slots the concentrator keeps in memory.
+    :param reuse_port: Bind with SO_REUSEPORT so several worker processes can share the port.
+    :param notify: Send the shutdown notification when stopped (workers leave it to their parent).
+    :param latest_depth: Recent samples kept per bus for the query server (see pdc_latest).
+    :param query_ip: Address the query server listens on.
+    :param query_port: HTTP port of the query server (None disables it).
+    :param telemetry_file: Append per-PMU and per-bus telemetry snapshots here as JSON lines
+        (see pdc_telemetry; None disables telemetry).
+    :param telemetry_interval: Seconds between telemetry snapshots.
+    :param notify_options: Keyword arguments for pdc_notify.Notifier (iface, burst, burst_gap).
+    :param heartbeat_ip: Controller address to send liveness heartbeats to (None disables them).
+    :param heartbeat_port: Controller heartbeat port.
+    :param heartbeat_interval: Seconds between heartbeats.
+    :param trace_file: Failover trace file: the shutdown notification and the first row stored from
+        every new (or long silent) source are recorded here (see failover_trace; None disables tracing).
+    :param trace_node: Name of this PDC in the trace (defaults to listen_ip).
+    :param home_sources: IPs of the PMUs that report to this PDC; their rows are not traced, so only
+        rerouted PMUs record a first row (None traces every source).
+    """
+    notifier = None
+    trace = None
+    heartbeat = None
+    writer = None
+    concentrator = None
+    telemetry = None
+    server_socket = None
+    ingest = None
+    latest = None
+    query_server = None
+
+    try:
+        # Serialize the notification and open its raw socket now, not when the PDC is already stopping.
+        if notify:
+            notifier = pdc_notify.open_notifier(mac_address=mac_address, listen_ip=listen_ip, pmu_count=pmu_count,
+                                                **(notify_options or {}))
+        trace = failover_trace.open_trace(trace_file, trace_node or listen_ip)
+        if notify and heartbeat_ip and heartbeat_port:
+            heartbeat = pdc_notify.HeartbeatSender(heartbeat_ip, heartbeat_port, listen_ip, pmu_count,
+                                                   heartbeat_interval)
+        backend = pdc_storage.open_backend(storage, csv_file, archive_file)
+        writer = pdc_storage.StorageWriter(backend, **(storage_options or {}))
+        timeout = stats_interval
+        if concentrate:
+            concentrator = pdc_concentrator.Concentrator(
+                pmu_count,
+                on_frame=lambda timestamp, rows, sources, complete: writer.put(rows, f"frame {timestamp}"),
+                on_late=lambda rows, source: writer.put(rows, source),
+                wait_window=wait_window, ring_size=ring_size)
+            timeout = min(stats_interval or wait_window, wait_window / 2)
+        if telemetry_file:
+            telemetry = pdc_telemetry.IngestTelemetry()
+            timeout = min(timeout or telemetry_interval, telemetry_interval)
+        if heartbeat:
+            timeout = min(timeout or heartbeat_interval, heartbeat_interval)
+
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((listen_ip, listen_port))
+        ingest = UdpIngest(server_socket, batch_size=batch_size, rcvbuf=rcvbuf)
+        print(f"PDC UDP server '{socket.gethostname()}' (pid {os.getpid()}) listening on {listen_ip}:{listen_port}, logging to {backend.path}")
+        traced_sources = {}  # source address -> monotonic time of its last row
+        if query_port is not None:
+            latest = pdc_latest.LatestStore(depth=latest_depth)
+            query_server = pdc_latest.QueryServer(latest, query_ip, query_port).start()
+            print(f"Latest values served on http://{query_ip}:{query_port}/latest")
+        next_stats = time.monotonic() + stats_interval if stats_interval else None
+        next_telemetry = time.monotonic() + telemetry_interval if telemetry else None
+        while True:
+            for data, addr in ingest.drain(timeout):
+                rows, failures = parse_datagram(data)
+                if telemetry:
+                    telemetry.record(addr, len(data), rows, failures)
+                if latest:
+                    latest.update(rows)
+                if concentrator:
+                    concentrator.add(rows, addr)
+                else:
+                    writer.put(rows, addr)
+                if trace and rows and not (home_sources and addr[0] in home_sources):
+                    # A new (or long silent) foreign source is how a backup PDC sees a rerouted PMU arrive.
+                    now = time.monotonic()
+                    last = traced_sources.get(addr)
+                    if last is None or now - last >= failover_trace.SOURCE_GAP:
+                        trace.record(failover_trace.FIRST_ROW, failover_trace.ip_key(addr[0]))
+                    traced_sources[addr] = now
+            if heartbeat:
+                heartbeat.tick()
+            if concentrator:
+                concentrator.poll()
+            if next_stats is not None and time.monotonic() >= next_stats:
+                print(f"Ingest: {ingest.stats()}")
+                if concentrator:
+                    print(f"Concentrator: {concentrator.stats()}")
+                next_stats = time.monotonic() + stats_interval
+            if next_telemetry is not None and time.monotonic() >= next_telemetry:
+                telemetry.dump(telemetry_file)
+                next_telemetry = time.monotonic() + telemetry_interval
+    except KeyboardInterrupt:
+        if notify:
+            send_shutdown_notification(notifier, trace)
 
         print("\nPDC UDP server stopped by user.")
+        if ingest:
+            print(f"Ingest: {ingest.stats()}")
     except Exception as e:
         print(f"A server error occurred: {e}", file=sys.stderr)
+        if notify:
+            # The PDC is going away all the same; let the switch move its PMUs.
+            send_shutdown_notification(notifier, trace)
+    finally:
+        if server_socket:
+            server_socket.close()
+        if notifier:
+            notifier.close()
+        if heartbeat:
+            heartbeat.close()
+        if query_server:
+            query_server.close()
+        if concentrator:
+            concentrator.flush()
+            print(f"Concentrator: {concentrator.stats()}")
+        if writer:
+            writer.close()
+            print(f"Storage: {writer.stats()}")
+        if telemetry:
+            telemetry.dump(telemetry_file)
+            print(f"Telemetry: {telemetry.summary()}")
+        if trace:
+            trace.close()
+
+def pdc_run_workers(workers, listen_ip, listen_port, csv_file, pmu_count, mac_address, storage='csv',
+                    archive_file=None, merge_on_exit=True, notify_options=None, heartbeat_ip=None,
+                    heartbeat_port=None, heartbeat_interval=0.05, **options):
+    """
+    Runs pdc_recv in several processes bound to the same address with SO_REUSEPORT.
+
+    The kernel spreads PMU flows across the workers (each flow always lands on
+    the same one). Every worker writes its own shard of the output; a manifest
+    next to the output lists the shards, and they are merged back into the
+    output in timestamp order when the PDC stops (or later with --merge).
+    Only this parent process sends the shutdown notification, and the
+    heartbeats while every worker is alive. With a query
+    port, worker i serves the buses it receives on query_port + i; telemetry
+    goes to one file per worker, named like the shards.
+
+    :param workers: Number of worker processes.
+    :param merge_on_exit: Merge the shards into the output once all workers have stopped.
+    See pdc_recv for the other parameters.
+    """
+    output = pdc_storage.storage_path(storage, csv_file, archive_file)
+    manifest = pdc_storage.write_manifest(storage, output, workers)
+    if options.get('concentrate'):
+        print("Warning: each worker only sees its share of the PMUs; disabling the concentrator.", file=sys.stderr)
+        options['concentrate'] = False
+
+    processes = []
+    for i in range(workers):
+        shard = pdc_storage.shard_path(output, i)
+        kwargs = dict(options, storage=storage, reuse_port=True, notify=False)
+        if options.get('query_port') is not None:
+            kwargs['query_port'] = options['query_port'] + i
+        if options.get('telemetry_file'):
+            kwargs['telemetry_file'] = pdc_storage.shard_path(options['telemetry_file'], i)
+        if options.get('trace_file'):
+            kwargs['trace_file'] = pdc_storage.shard_path(options['trace_file'], i)
+            kwargs['trace_node'] = f"{options.get('trace_node') or listen_ip}.w{i}"
+        if storage == 'columnar':
+            kwargs['archive_file'] = shard
+            shard_csv = csv_file
+        else:
+            shard_csv = shard
+        process = multiprocessing.Process(target=pdc_recv, name=f"pdc-worker-{i}",
+                                          args=(listen_ip, listen_port, shard_csv, pmu_count, mac_address),
+                                          kwargs=kwargs)
+        process.start()
+        processes.append(process)
+    print(f"PDC started {workers} workers on {listen_ip}:{listen_port}, manifest {manifest}")
+    notifier = pdc_notify.open_notifier(mac_address=mac_address, listen_ip=listen_ip, pmu_count=pmu_count,
+                                        **(notify_options or {}))
+    heartbeat = None
+    if heartbeat_ip and heartbeat_port:
+        heartbeat = pdc_notify.HeartbeatSender(heartbeat_ip, heartbeat_port, listen_ip, pmu_count, heartbeat_interval)
+    trace = failover_trace.open_trace(options.get('trace_file'), options.get('trace_node') or listen_ip)
+
+    try:
+        while all(process.is_alive() for process in processes):
+            if heartbeat:
+                heartbeat.tick()
+            time.sleep(heartbeat_interval if heartbeat else 0.5)
+        print("A PDC worker exited unexpectedly; stopping the others.", file=sys.stderr)
+    except KeyboardInterrupt:
+        send_shutdown_notification(notifier, trace)
+        print("\nPDC stopped by user.")
     finally:
-        server_socket.close()
+        if notifier:
+            notifier.close()
+        if heartbeat:
+            heartbeat.close()
+        if trace:
+            trace.close()
+        # Workers normally get the same SIGINT; give them a moment to flush before terminating.
+        for process in processes:
+            process.join(timeout=2)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=10)
+        if merge_on_exit:
+            rows = pdc_storage.merge_shards(manifest)
+            print(f"Merged {rows} rows from {workers} shards into {output}")
+
+def parse_datagram(data):
+    """
+    Unpacks one PMU datagram into rows.
+
+    A datagram holds a single text measurement, a batched text frame with one
+    line per bus for the same reporting instant, or a binary data frame (see
+    pmu_frames). The format is detected from the first byte.
+
+    :param data: The raw datagram payload (bytes or memoryview).
+    :return: ([busID, voltage, phaseAngle, timestamp] rows, number of lines or frames that failed to parse).
+    """
+    if pmu_frames.is_binary_frame(data):
+        try:
+            return pmu_frames.decode_frame(data), 0
+        except pmu_frames.FrameError:
+            return [], 1
+
+    rows = []
+    failures = 0
+    for line in str(data, 'utf-8', 'replace').split('\n'):
+        parsed = parse_pmu_message(line)
+        if parsed:
+            rows.append(parsed)
+        elif line.strip():
+            failures += 1
+    return rows, failures
 
 def parse_pmu_message(message):
     try:
@@ -126,10 +434,105 @@ if __name__ == "__main__":
                         help=f"Number of PMUs connected to host at network init. (default for this host: {host_config.get('pmu')})")
     parser.add_argument('--mac', type=str, default=host_config.get('mac'),
                             help=f"Mac Address. (default for this host: {host_config.get('mac')})")
+    parser.add_argument('--rcvbuf', type=int, default=host_config.get('rcvbuf'),
+                        help="Socket receive buffer size (SO_RCVBUF) in bytes.")
+    parser.add_argument('--batch-size', type=int, default=host_config.get('batch_size', 64),
+                        help="Maximum datagrams drained from the socket per wake-up.")
+    parser.add_argument('--stats-interval', type=float, default=host_config.get('stats_interval'),
+                        help="Seconds between ingest statistics printouts.")
+    parser.add_argument('--queue-size', type=int, default=host_config.get('queue_size', 10000),
+                        help="Datagrams' worth of rows the storage queue holds before the overflow policy applies.")
+    parser.add_argument('--flush-rows', type=int, default=host_config.get('flush_rows', 512),
+                        help="Rows written to storage per batch.")
+    parser.add_argument('--flush-interval', type=float, default=host_config.get('flush_interval', 1.0),
+                        help="Maximum seconds rows wait before being written and flushed.")
+    parser.add_argument('--overflow', type=str, choices=pdc_storage.OVERFLOW_POLICIES,
+                        default=host_config.get('overflow', 'block'),
+                        help="What to do when the storage queue is full.")
+    parser.add_argument('--quiet', action=argparse.BooleanOptionalAction, default=host_config.get('quiet', False),
+                        help="Print periodic storage summaries instead of one line per stored row.")
+    parser.add_argument('--summary-interval', type=float, default=host_config.get('summary_interval', 10.0),
+                        help="Seconds between storage summaries in quiet mode.")
+    parser.add_argument('--storage', type=str, choices=pdc_storage.STORAGE_BACKENDS,
+                        default=host_config.get('storage', 'csv'),
+                        help="Storage backend: CSV rows or a chunked columnar archive.")
+    parser.add_argument('--archive', type=str, default=host_config.get('archive_file'),
+                        help="Columnar archive path (default: the CSV path with a .pdca suffix).")
+    parser.add_argument('--concentrate', action=argparse.BooleanOptionalAction,
+                        default=host_config.get('concentrate', False),
+                        help="Time-align measurements from all of this PDC's PMUs before storing them.")
+    parser.add_argument('--wait-window', type=float, default=host_config.get('wait_window', 0.1),
+                        help="Seconds the concentrator waits for missing PMUs in a time slot.")
+    parser.add_argument('--ring-size', type=int, default=host_config.get('ring_size', 256),
+                        help="Number of time slots the concentrator keeps in memory.")
+    parser.add_argument('--query-port', type=int, default=host_config.get('query_port'),
+                        help="Serve the latest values per bus over HTTP on this port (disabled by default).")
+    parser.add_argument('--query-ip', type=str, default=host_config.get('query_ip', '127.0.0.1'),
+                        help="Address the query server listens on.")
+    parser.add_argument('--latest-depth', type=int, default=host_config.get('latest_depth', 16),
+                        help="Recent samples kept per bus for the query server.")
+    parser.add_argument('--telemetry-file', type=str, default=host_config.get('telemetry_file'),
+                        help="Append per-PMU/per-bus telemetry snapshots to this file as JSON lines.")
+    parser.add_argument('--telemetry-interval', type=float, default=host_config.get('telemetry_interval', 10.0),
+                        help="Seconds between telemetry snapshots.")
+    parser.add_argument('--notify-iface', type=str, default=host_config.get('notify_iface', 'eth0'),
+                        help="Interface the shutdown notification is sent on.")
+    parser.add_argument('--notify-burst', type=int, default=host_config.get('notify_burst', 1),
+                        help="Copies of the shutdown notification to send, in case one is lost.")
+    parser.add_argument('--notify-gap', type=float, default=host_config.get('notify_gap', 0.001),
+                        help="Seconds between copies of the shutdown notification.")
+    parser.add_argument('--heartbeat-ip', type=str, default=host_config.get('heartbeat_ip'),
+                        help="Send liveness heartbeats to the switch controller at this address (heartbeat_ip in "
+                             "pdc_config.json; it must reach the controller's --heartbeat-ip). Empty disables them.")
+    parser.add_argument('--heartbeat-port', type=int, default=host_config.get('heartbeat_port'),
+                        help="UDP port of the controller's heartbeat monitor.")
+    parser.add_argument('--heartbeat-interval', type=float, default=host_config.get('heartbeat_interval', 0.05),
+                        help="Seconds between heartbeats.")
+    parser.add_argument('--trace-file', type=str, default=host_config.get('trace_file'),
+                        help="Record failover trace events (shutdown notification, first row per source) here.")
+    parser.add_argument('--workers', type=int, default=host_config.get('workers', 1),
+                        help="Receive with this many SO_REUSEPORT worker processes, each writing its own shard.")
+    parser.add_argument('--merge-on-exit', action=argparse.BooleanOptionalAction,
+                        default=host_config.get('merge_on_exit', True),
+                        help="With --workers, merge the shards into the output when the PDC stops.")
+    parser.add_argument('--merge', action='store_true',
+                        help="Merge the shards left by an earlier multi-worker run and exit.")
     args = parser.parse_args()
 
+    if args.merge:
+        output = pdc_storage.storage_path(args.storage, args.csv, args.archive)
+        rows = pdc_storage.merge_shards(pdc_storage.manifest_path(output))
+        print(f"Merged {rows} rows into {output}")
+        sys.exit(0)
+
     if not all([args.name, args.ip, args.port, args.csv, args.pmu, args.mac]):
         print("Error: A required setting (name, ip, port, pmu, mac, or csv) is missing.", file=sys.stderr)
         sys.exit(1)
 
-    pdc_recv(args.ip, args.port, args.csv, args.pmu, args.mac)
\ No newline at end of file
+    home_sources = None
+    if args.trace_file:
+        try:
+            home_sources = {pmu for pmu, pdc in failover_trace.pmu_homes('pmu_config.json', 'topology.json').items()
+                            if pdc == args.ip}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: cannot read the PMUs of {args.name} ({e}); tracing the first row of every source",
+                  file=sys.stderr)
+
+    options = dict(rcvbuf=args.rcvbuf, batch_size=args.batch_size, stats_interval=args.stats_interval,
+                   storage_options={'queue_size': args.queue_size, 'flush_rows': args.flush_rows,
+                                    'flush_interval': args.flush_interval, 'overflow': args.overflow,
+                                    'quiet': args.quiet, 'summary_interval': args.summary_interval},
+                   storage=args.storage, archive_file=args.archive,
+                   concentrate=args.concentrate, wait_window=args.wait_window, ring_size=args.ring_size,
+                   latest_depth=args.latest_depth, query_ip=args.query_ip, query_port=args.query_port,
+                   telemetry_file=args.telemetry_file, telemetry_interval=args.telemetry_interval,
+                   notify_options={'iface': args.notify_iface, 'burst': args.notify_burst,
+                                   'burst_gap': args.notify_gap},
+                   heartbeat_ip=args.heartbeat_ip, heartbeat_port=args.heartbeat_port,
+                   heartbeat_interval=args.heartbeat_interval,
+                   trace_file=args.trace_file, trace_node=args.name, home_sources=home_sources)
+    if args.workers > 1:
+        pdc_run_workers(args.workers, args.ip, args.port, args.csv, args.pmu, args.mac,
+                        merge_on_exit=args.merge_on_exit, **options)
+    else:
+        pdc_recv(args.ip, args.port, args.csv, args.pmu, args.mac, **options)
@@ -0,0 +1,135 @@
+"""
+Time-aligned frame concentrator for the PDC.
+
+PMUs stamp each frame with its aligned reporting instant (see
+pmu.FrameScheduler), so every PMU's frame for the same instant carries the
+same timestamp. The concentrator buckets incoming rows by that timestamp and
+emits one aligned frame per time slot as soon as every expected PMU has
+reported, or when the slot's wait window runs out.
+
+Slots live in a fixed-size ring indexed by slot number, so memory stays
+bounded at any frame rate. A PMU is identified by the address its datagrams
+come from. Rows that arrive after their slot was emitted are counted as
+late and handed to the on_late callback instead.
+
+Works best with batched or binary PMU frames; with one datagram per bus a
+PMU counts as reported after its first bus.
+"""
+import time
+
+
+class Slot:
+    __slots__ = ('key', 'timestamp', 'opened', 'sources', 'rows', 'emitted')
+
+    def __init__(self):
+        self.key = None
+        self.emitted = True
+
+    def open(self, key, timestamp, now):
+        self.key = key
+        self.timestamp = timestamp
+        self.opened = now
+        self.sources = set()
+        self.rows = []
+        self.emitted = False
+
+
+class Concentrator:
+    """Buckets measurements from several PMUs into time-aligned frames."""
+
+    def __init__(self, expected_pmus, on_frame, on_late=None, wait_window=0.1, ring_size=256, resolution=0.001):
+        """
+        :param expected_pmus: Number of PMUs that report to this PDC (pdc_config.json 'pmu').
+        :param on_frame: Called as on_frame(timestamp, rows, sources, complete) for every emitted slot.
+        :param on_late: Called as on_late(rows, source) for rows whose slot was already emitted.
+        :param wait_window: Seconds a slot waits for missing PMUs after its first rows arrive.
+        :param ring_size: Number of slots held in memory.
+        :param resolution: Timestamps within this many seconds share a slot.
+        """
+        self.expected_pmus = expected_pmus
+        self.on_frame = on_frame
+        self.on_late = on_late
+        self.wait_window = wait_window
+        self.resolution = resolution
+        self.ring = [Slot() for _ in range(ring_size)]
+        self.open_slots = 0
+
+        self.known_sources = set()
+        self.frames = 0
+        self.complete = 0
+        self.partial = 0
+        self.evicted = 0
+        self.late_rows = 0
+        self.missing = {}
+
+    def add(self, rows, source, now=None):
+        """Adds the rows of one datagram from source."""
+        if not rows:
+            return
+        now = time.monotonic() if now is None else now
+        self.known_sources.add(source)
+
+        by_key = {}
+        for row in rows:
+            by_key.setdefault(round(row[3] / self.resolution), []).append(row)
+
+        for key, key_rows in by_key.items():
+            slot = self.ring[key % len(self.ring)]
+            if slot.key != key:
+                if slot.key is not None and key < slot.key:
+                    # The slot was recycled for a newer instant long ago.
+                    self._late(key_rows, source)
+                    continue
+                if not slot.emitted:
+                    self.evicted += 1
+                    self._emit(slot)
+                slot.open(key, key_rows[0][3], now)
+                self.open_slots += 1
+            elif slot.emitted:
+                self._late(key_rows, source)
+                continue
+
+            slot.rows.extend(key_rows)
+            slot.sources.add(source)
+            if len(slot.sources) >= self.expected_pmus:
+                self._emit(slot)
+
+    def poll(self, now=None):
+        """Emits every open slot whose wait window has expired."""
+        if not self.open_slots:
+            return
+        now = time.monotonic() if now is None else now
+        expired = [slot for slot in self.ring if not slot.emitted and now - slot.opened >= self.wait_window]
+        for slot in sorted(expired, key=lambda slot: slot.key):
+            self._emit(slot)
+
+    def flush(self):
+        """Emits every open slot regardless of its wait window (used on shutdown)."""
+        for slot in sorted((slot for slot in self.ring if not slot.emitted), key=lambda slot: slot.key):
+            self._emit(slot)
+
+    def _emit(self, slot):
+        slot.emitted = True
+        self.open_slots -= 1
+        self.frames += 1
+        complete = len(slot.sources) >= self.expected_pmus
+        if complete:
+            self.complete += 1
+        else:
+            self.partial += 1
+            for source in self.known_sources - slot.sources:
+                self.missing[source] = self.missing.get(source, 0) + 1
+        self.on_frame(slot.timestamp, slot.rows, slot.sources, complete)
+        slot.rows = []
+
+    def _late(self, rows, source):
+        self.late_rows += len(rows)
+        if self.on_late:
+            self.on_late(rows, source)
+
+    def stats(self):
+        missing = ', '.join(f"{source[0]}:{source[1]}={count}" if isinstance(source, tuple) else f"{source}={count}"
+                            for source, count in sorted(self.missing.items(), key=lambda item: -item[1])[:5])
+        return (f"{self.frames} frames ({self.complete} complete, {self.partial} partial, {self.evicted} evicted), "
+                f"{self.late_rows} late rows, {len(self.known_sources)}/{self.expected_pmus} PMUs seen"
+                + (f", most missed: {missing}" if missing else ""))
@@ -0,0 +1,173 @@
+"""
+Latest-value store and local query server for the PDC.
+
+LatestStore keeps the last `depth` samples of every bus in flat, array-backed
+ring buffers. Each bus ID is mapped to an integer slot the first time it is
+seen; slot s owns entries [s * depth, (s + 1) * depth) of the timestamp,
+voltage and angle arrays, and head[s] is where its next sample goes. Updating
+a bus and reading its latest sample or a short window are O(1) in the number
+of buses, and memory does not grow with the amount of data received.
+
+QueryServer answers read-only HTTP requests from a background thread, meant
+for dashboards on the same host:
+
+    GET /buses                  bus IDs currently held
+    GET /latest                 latest sample of every bus
+    GET /latest/<busID>         latest sample of one bus
+    GET /window/<busID>?n=10    up to n most recent samples, oldest first
+
+Samples are returned as JSON objects {"busID", "voltage", "phaseAngle",
+"timestamp"}. Buses are in arrival order, i.e. latest means most recently
+received.
+"""
+import json
+import threading
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class LatestStore:
+    """Fixed-depth ring buffer of recent samples per bus."""
+
+    def __init__(self, depth=16, capacity=64):
+        """
+        :param depth: Samples kept per bus.
+        :param capacity: Initial number of bus slots; doubled whenever it runs out.
+        """
+        self.depth = depth
+        self.capacity = capacity
+        self.slots = {}
+        self.bus_ids = []
+        self.timestamp = array('d', bytes(8 * capacity * depth))
+        self.voltage = array('d', bytes(8 * capacity * depth))
+        self.angle = array('d', bytes(8 * capacity * depth))
+        self.head = array('l', bytes(array('l').itemsize * capacity))
+        self.count = array('l', bytes(array('l').itemsize * capacity))
+        self.lock = threading.Lock()
+
+    def _slot(self, bus_id):
+        slot = self.slots.get(bus_id)
+        if slot is None:
+            slot = len(self.bus_ids)
+            if slot == self.capacity:
+                self._grow()
+            self.slots[bus_id] = slot
+            self.bus_ids.append(bus_id)
+        return slot
+
+    def _grow(self):
+        added = self.capacity
+        for column in (self.timestamp, self.voltage, self.angle):
+            column.frombytes(bytes(8 * added * self.depth))
+        for column in (self.head, self.count):
+            column.frombytes(bytes(column.itemsize * added))
+        self.capacity += added
+
+    def update(self, rows):
+        """Records [busID, voltage, phaseAngle, timestamp] rows."""
+        depth = self.depth
+        with self.lock:
+            for bus_id, voltage, angle, timestamp in rows:
+                slot = self._slot(bus_id)
+                head = self.head[slot]
+                i = slot * depth + head
+                self.timestamp[i] = timestamp
+                self.voltage[i] = voltage
+                self.angle[i] = angle
+                self.head[slot] = (head + 1) % depth
+                if self.count[slot] < depth:
+                    self.count[slot] += 1
+
+    def _sample(self, slot, position):
+        i = slot * self.depth + position
+        return {'busID': self.bus_ids[slot], 'voltage': self.voltage[i],
+                'phaseAngle': self.angle[i], 'timestamp': self.timestamp[i]}
+
+    def latest(self, bus_id):
+        """The most recent sample of bus_id, or None if it has not reported."""
+        with self.lock:
+            slot = self.slots.get(bus_id)
+            if slot is None:
+                return None
+            return self._sample(slot, (self.head[slot] - 1) % self.depth)
+
+    def window(self, bus_id, n=None):
+        """Up to n most recent samples of bus_id (all held samples by default), oldest first."""
+        with self.lock:
+            slot = self.slots.get(bus_id)
+            if slot is None:
+                return []
+            n = self.count[slot] if n is None else max(0, min(n, self.count[slot]))
+            head = self.head[slot]
+            return [self._sample(slot, (head - k) % self.depth) for k in range(n, 0, -1)]
+
+    def snapshot(self):
+        """Latest sample of every bus."""
+        with self.lock:
+            return [self._sample(slot, (self.head[slot] - 1) % self.depth) for slot in range(len(self.bus_ids))]
+
+    def buses(self):
+        with self.lock:
+            return list(self.bus_ids)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        store = self.server.store
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+
+        if parts == ['buses']:
+            self.reply(200, store.buses())
+        elif parts == ['latest']:
+            self.reply(200, store.snapshot())
+        elif len(parts) == 2 and parts[0] == 'latest':
+            sample = store.latest(parts[1])
+            if sample is None:
+                self.reply(404, {'error': f"unknown bus {parts[1]}"})
+            else:
+                self.reply(200, sample)
+        elif len(parts) == 2 and parts[0] == 'window':
+            try:
+                n = int(parse_qs(url.query).get('n', [store.depth])[0])
+            except ValueError:
+                self.reply(400, {'error': "n must be an integer"})
+                return
+            if parts[1] not in store.slots:
+                self.reply(404, {'error': f"unknown bus {parts[1]}"})
+            else:
+                self.reply(200, store.window(parts[1], n))
+        else:
+            self.reply(404, {'error': "use /buses, /latest, /latest/<busID> or /window/<busID>?n=N"})
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Dashboards poll frequently; keep them out of the PDC's console output.
+        pass
+
+
+class QueryServer:
+    """Serves a LatestStore over HTTP from a daemon thread."""
+
+    def __init__(self, store, ip='127.0.0.1', port=8080):
+        self.httpd = ThreadingHTTPServer((ip, port), QueryHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.store = store
+        self.address = self.httpd.server_address
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="pdc-query", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,197 @@
+"""
+PDC notifications to the switch and its controller, without scapy.
+
+A PDC tells its switch that it is going away by sending an IPv4 packet with
+protocol 253 carrying a net_hdr (see basic.p4):
+
+    disconnected_pmus  7 bits   number of PMUs that lose their PDC
+    ip_value          32 bits   the PDC's IP address
+    rtype              1 bit    0 = PDC down
+
+The switch parser stops after net_hdr and turns it into a net_report_t
+digest for the controller. After net_hdr we append a trailer the switch
+ignores: the send time (u64 nanoseconds since the epoch) and the copy's
+number in the burst (u16). It shows up in the switch pcaps, so it can be
+compared with the controller's rule-install time to measure detection to
+reroute latency.
+
+The frame is serialized once at startup and sent on a raw AF_PACKET socket
+that is also opened at startup, so sending only patches the trailer and
+makes one send() call per copy.
+
+Heartbeats are small UDP datagrams sent straight to the switch controller,
+which runs a failure detector on them (see failure_detector.py). This needs
+an IP path from the PDC host to the controller; the P4 program has no
+packet-in path the heartbeats could use instead.
+"""
+import ipaddress
+import socket
+import struct
+import sys
+import time
+
+NET_HDR_PROTO = 253
+ETH_P_IP = 0x0800
+BROADCAST_MAC = 'ff:ff:ff:ff:ff:ff'
+# Destination used by the original scapy notification; the switch only looks at the protocol.
+NOTIFY_DST_IP = '10.0.0.1'
+
+TRAILER = struct.Struct('!QH')
+IPV4_HEADER = struct.Struct('!BBHHHBBH4s4s')
+
+
+def mac_bytes(mac):
+    return bytes(int(part, 16) for part in mac.split(':'))
+
+
+def pack_net_hdr(disconnected_pmus, ip_value, rtype):
+    """The 40-bit net_hdr as 5 bytes."""
+    value = ((disconnected_pmus & 0x7F) << 33) | ((ip_value & 0xFFFFFFFF) << 1) | (rtype & 1)
+    return value.to_bytes(5, 'big')
+
+
+def ipv4_checksum(header):
+    total = sum(struct.unpack(f'!{len(header) // 2}H', header))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def ipv4_header(src_ip, dst_ip, proto, payload_len, ident=1, ttl=64):
+    """A 20-byte IPv4 header with its checksum filled in (same defaults as scapy's IP())."""
+    fields = [0x45, 0, 20 + payload_len, ident, 0, ttl, proto, 0,
+              ipaddress.ip_address(src_ip).packed, ipaddress.ip_address(dst_ip).packed]
+    fields[7] = ipv4_checksum(IPV4_HEADER.pack(*fields))
+    return IPV4_HEADER.pack(*fields)
+
+
+def build_frame(src_mac, src_ip, payload, dst_mac=BROADCAST_MAC, dst_ip=NOTIFY_DST_IP, proto=NET_HDR_PROTO):
+    """Ethernet + IPv4 frame around payload."""
+    return (mac_bytes(dst_mac) + mac_bytes(src_mac) + ETH_P_IP.to_bytes(2, 'big')
+            + ipv4_header(src_ip, dst_ip, proto, len(payload)) + payload)
+
+
+def build_notification(mac_address, listen_ip, pmu_count, rtype=0):
+    """The shutdown notification frame with a zeroed trailer, as a bytearray."""
+    net_hdr = pack_net_hdr(pmu_count, int(ipaddress.ip_address(listen_ip)), rtype)
+    return bytearray(build_frame(mac_address, listen_ip, net_hdr + bytes(TRAILER.size)))
+
+
+class Notifier:
+    """Sends a pre-serialized notification frame on an already-open raw socket."""
+
+    def __init__(self, iface, mac_address, listen_ip, pmu_count, rtype=0, burst=1, burst_gap=0.001):
+        """
+        :param iface: Interface the frame is sent on (e.g. eth0).
+        :param mac_address: Source MAC address.
+        :param listen_ip: The PDC's IP address (source IP and net_hdr ip_value).
+        :param pmu_count: Number of PMUs reported as disconnected.
+        :param rtype: net_hdr rtype.
+        :param burst: Copies sent per notification, in case one is lost.
+        :param burst_gap: Seconds between copies.
+        :raises OSError: If the raw socket cannot be opened (needs CAP_NET_RAW).
+        """
+        self.iface = iface
+        self.burst = max(1, burst)
+        self.burst_gap = burst_gap
+        self.ip_value = int(ipaddress.ip_address(listen_ip))
+        self.frame = build_notification(mac_address, listen_ip, pmu_count, rtype)
+        self.trailer_offset = len(self.frame) - TRAILER.size
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        self.sock.bind((iface, 0))
+
+    def send(self):
+        """Sends the burst and returns the UNIX time the first copy was sent."""
+        sent = time.time_ns()
+        for copy in range(self.burst):
+            if copy:
+                time.sleep(self.burst_gap)
+                stamp = time.time_ns()
+            else:
+                stamp = sent
+            TRAILER.pack_into(self.frame, self.trailer_offset, stamp, copy)
+            self.sock.send(self.frame)
+        return sent / 1e9
+
+    def close(self):
+        self.sock.close()
+
+
+def open_notifier(iface, mac_address, listen_ip, pmu_count, **options):
+    """Returns a Notifier, or None (with a warning) if the raw socket cannot be opened."""
+    try:
+        return Notifier(iface, mac_address, listen_ip, pmu_count, **options)
+    except OSError as e:
+        print(f"Warning: cannot open a raw socket on {iface} ({e}); shutdown notifications are disabled.", file=sys.stderr)
+        return None
+
+
+# Heartbeats: magic, version, flags, PMU count, PDC IP, sequence number, send time (ns since the epoch).
+HEARTBEAT = struct.Struct('!4sBBB4sIQ')
+HEARTBEAT_MAGIC = b'PDHB'
+HEARTBEAT_VERSION = 1
+HEARTBEAT_STOPPING = 0x01
+
+
+def encode_heartbeat(listen_ip, pmu_count, seq, timestamp_ns, flags=0):
+    return HEARTBEAT.pack(HEARTBEAT_MAGIC, HEARTBEAT_VERSION, flags, pmu_count,
+                          ipaddress.ip_address(listen_ip).packed, seq & 0xFFFFFFFF, timestamp_ns)
+
+
+def decode_heartbeat(data):
+    """Returns (ip_value, pmu_count, seq, timestamp_ns, flags), or None if data is not a heartbeat."""
+    if len(data) != HEARTBEAT.size:
+        return None
+    magic, version, flags, pmu_count, ip, seq, timestamp_ns = HEARTBEAT.unpack(data)
+    if magic != HEARTBEAT_MAGIC or version != HEARTBEAT_VERSION:
+        return None
+    return int.from_bytes(ip, 'big'), pmu_count, seq, timestamp_ns, flags
+
+
+class HeartbeatSender:
+    """
+    Periodic liveness datagrams from a PDC to its switch controller.
+
+    The receive loop calls tick() on every wake-up, so heartbeats stop when
+    the loop stops making progress, not only when the process exits.
+    """
+
+    def __init__(self, target_ip, target_port, listen_ip, pmu_count, interval=0.05):
+        """
+        :param target_ip: Controller address (see failure_detector.HeartbeatMonitor).
+        :param target_port: Controller heartbeat port.
+        :param listen_ip: The PDC's IP address, which identifies it to the controller.
+        :param pmu_count: Number of PMUs that lose their PDC if this one fails.
+        :param interval: Seconds between heartbeats.
+        """
+        self.target = (target_ip, target_port)
+        self.listen_ip = listen_ip
+        self.pmu_count = pmu_count
+        self.interval = interval
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.seq = 0
+        self.next_beat = 0.0
+        self.errors = 0
+
+    def tick(self, now=None):
+        """Sends a heartbeat if one is due."""
+        now = time.monotonic() if now is None else now
+        if now >= self.next_beat:
+            self.beat()
+            self.next_beat = now + self.interval
+
+    def beat(self, flags=0):
+        self.seq += 1
+        try:
+            self.sock.sendto(encode_heartbeat(self.listen_ip, self.pmu_count, self.seq, time.time_ns(), flags),
+                             self.target)
+        except OSError:
+            # An unreachable controller must never stop the PDC.
+            self.errors += 1
+
+    def close(self, stopping=True):
+        """Closes the socket, first telling the controller this PDC is stopping on purpose."""
+        if stopping:
+            self.beat(HEARTBEAT_STOPPING)
+        self.sock.close()
@@ -0,0 +1,549 @@
+"""
+Storage stage of the PDC.
+
+The receive loop hands parsed rows to a StorageWriter, which queues them and
+writes them from a background thread, so disk and console speed never hold
+up draining the socket. Backends do the actual writing:
+
+    CsvBackend        one text row per measurement (the original format)
+    ColumnarBackend   chunked columnar archive (.pdca), see below
+
+Archive layout (little-endian). The file starts with an 8-byte header
+(b'PDCA', u16 version, u16 reserved) followed by self-contained chunks:
+
+    timestamp   int64 x rows    nanoseconds since the epoch
+    voltage     float32 x rows
+    phaseAngle  float32 x rows
+    busID code  uint16 x rows   index into the chunk dictionary
+    dictionary  dict_bytes      bus IDs joined by newlines (UTF-8)
+    padding     to a multiple of 8 bytes
+    footer      min_ts int64, max_ts int64, rows u32, data_bytes u32,
+                dict_bytes u32, b'KNHC'
+
+Every chunk starts 8-byte aligned, so columns can be used straight from an
+mmap. Footers chain backwards from the end of the file, which lets a reader
+find the chunks overlapping a time range without touching their data.
+
+Run as a script to inspect or export an archive:
+
+    python3 pdc_storage.py info pdc_data/pdc1_data.pdca
+    python3 pdc_storage.py export pdc_data/pdc1_data.pdca --start 1751309784 --end 1751309790
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import mmap
+import os
+import queue
+import shutil
+import struct
+import sys
+import threading
+import time
+from array import array
+
+CSV_HEADER = ['busID', 'voltage', 'phaseAngle', 'timestamp']
+
+ARCHIVE_MAGIC = b'PDCA'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('<4sHH')
+CHUNK_FOOTER = struct.Struct('<qqIII4s')
+CHUNK_MAGIC = b'KNHC'
+
+STORAGE_BACKENDS = ('csv', 'columnar')
+
+OVERFLOW_POLICIES = ('block', 'drop-newest', 'drop-oldest')
+
+
+class CsvBackend:
+    """Appends rows to a CSV file, writing the header if the file is new."""
+
+    def __init__(self, csv_file):
+        self.path = csv_file
+        new_file = not os.path.isfile(csv_file)
+        self.file = open(csv_file, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if new_file:
+            self.writer.writerow(CSV_HEADER)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _little_endian(column):
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+class ColumnarBackend:
+    """
+    Writes rows to a chunked columnar archive (see module docstring).
+
+    Rows are buffered per column and written as one chunk every chunk_rows
+    rows; flush() also writes a partial chunk once its oldest row is older
+    than max_chunk_age seconds, so little is lost on a crash at low rates.
+    """
+
+    def __init__(self, path, chunk_rows=8192, max_chunk_age=5.0):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.max_chunk_age = max_chunk_age
+        new_file = not os.path.isfile(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab')
+        if new_file:
+            self.file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0))
+        self.chunks = 0
+        self._reset()
+
+    def _reset(self):
+        self.timestamps = array('q')
+        self.voltages = array('f')
+        self.angles = array('f')
+        self.codes = array('H')
+        self.dictionary = {}
+        self.chunk_started = None
+
+    def write_rows(self, rows):
+        if self.chunk_started is None:
+            self.chunk_started = time.monotonic()
+        dictionary = self.dictionary
+        for bus_id, voltage, angle, timestamp in rows:
+            code = dictionary.get(bus_id)
+            if code is None:
+                code = dictionary[bus_id] = len(dictionary)
+            self.codes.append(code)
+            self.voltages.append(voltage)
+            self.angles.append(angle)
+            self.timestamps.append(int(round(timestamp * 1e9)))
+            if len(self.timestamps) >= self.chunk_rows:
+                self._write_chunk()
+                dictionary = self.dictionary
+
+    def _write_chunk(self):
+        rows = len(self.timestamps)
+        if not rows:
+            return
+        dictionary = '\n'.join(self.dictionary).encode('utf-8')
+        data_bytes = rows * (8 + 4 + 4 + 2) + len(dictionary)
+        padding = -data_bytes % 8
+        self.file.write(_little_endian(self.timestamps).tobytes())
+        self.file.write(_little_endian(self.voltages).tobytes())
+        self.file.write(_little_endian(self.angles).tobytes())
+        self.file.write(_little_endian(self.codes).tobytes())
+        self.file.write(dictionary)
+        self.file.write(b'\0' * padding)
+        self.file.write(CHUNK_FOOTER.pack(min(self.timestamps), max(self.timestamps), rows,
+                                          data_bytes + padding, len(dictionary), CHUNK_MAGIC))
+        self.chunks += 1
+        self._reset()
+
+    def flush(self):
+        if self.chunk_started is not None and time.monotonic() - self.chunk_started >= self.max_chunk_age:
+            self._write_chunk()
+        self.file.flush()
+
+    def close(self):
+        self._write_chunk()
+        self.file.close()
+
+
+def open_backend(kind, csv_file, archive_file=None, **options):
+    """
+    Creates a storage backend.
+
+    :param kind: 'csv' or 'columnar'.
+    :param csv_file: The PDC's CSV file.
+    :param archive_file: Archive path for the columnar backend; defaults to csv_file with a .pdca suffix.
+    :param options: Extra keyword arguments for the backend (e.g. chunk_rows).
+    """
+    if kind == 'csv':
+        return CsvBackend(csv_file)
+    if kind == 'columnar':
+        return ColumnarBackend(storage_path(kind, csv_file, archive_file), **options)
+    raise ValueError(f"Unknown storage backend '{kind}' (expected one of {', '.join(STORAGE_BACKENDS)})")
+
+
+def storage_path(kind, csv_file, archive_file=None):
+    """Path open_backend(kind, csv_file, archive_file) writes to."""
+    if kind == 'columnar':
+        return archive_file or os.path.splitext(csv_file)[0] + '.pdca'
+    return csv_file
+
+def shard_path(path, index):
+    """Per-worker shard of an output file: pdc1_data.csv -> pdc1_data.w0.csv."""
+    base, ext = os.path.splitext(path)
+    return f"{base}.w{index}{ext}"
+
+def manifest_path(path):
+    base, _ = os.path.splitext(path)
+    return f"{base}.manifest.json"
+
+def write_manifest(kind, output, workers):
+    """
+    Records which shard files make up a multi-worker PDC's output, so they can
+    be merged back into output later (see merge_shards).
+    """
+    path = manifest_path(output)
+    manifest = {
+        "storage": kind,
+        "output": output,
+        "shards": [shard_path(output, i) for i in range(workers)],
+        "started": time.time(),
+    }
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    return path
+
+# Rows handed to the backend at a time while merging shards.
+MERGE_BATCH_ROWS = 4096
+# Seconds by which a shard row may trail the newest row before it and still be merged in order.
+MERGE_REORDER_WINDOW = 5.0
+
+def read_shard(kind, path):
+    """Yields the rows of one shard file in file order."""
+    if kind == 'columnar':
+        reader = ArchiveReader(path)
+        try:
+            yield from reader.read_range()
+        finally:
+            reader.close()
+        return
+    with open(path, newline='') as f:
+        rows = csv.reader(f)
+        next(rows, None)
+        for bus_id, voltage, angle, timestamp in rows:
+            yield [bus_id, float(voltage), float(angle), float(timestamp)]
+
+def reorder(rows, window, late):
+    """
+    Yields rows in timestamp order, holding back only those within window
+    seconds of the newest row seen. A row that arrives after rows more than
+    window seconds newer than it have been yielded is yielded at once, out of
+    order, and counted in late[0].
+    """
+    pending = []
+    newest = None
+    last = None
+    for sequence, row in enumerate(rows):
+        timestamp = row[3]
+        if last is not None and timestamp < last:
+            late[0] += 1
+        newest = timestamp if newest is None else max(newest, timestamp)
+        heapq.heappush(pending, (timestamp, sequence, row))
+        while pending[0][0] <= newest - window:
+            last, _, ready = heapq.heappop(pending)
+            yield ready
+    while pending:
+        _, _, ready = heapq.heappop(pending)
+        yield ready
+
+def _update_manifest(manifest_file, manifest):
+    temporary = manifest_file + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(temporary, manifest_file)
+
+def merge_shards(manifest_file, window=MERGE_REORDER_WINDOW):
+    """
+    Merges the shards listed in a manifest into its output file in timestamp
+    order, then removes the shards and the manifest.
+
+    Each shard is written in arrival order, which is nearly timestamp order:
+    every shard is put in order within MERGE_REORDER_WINDOW seconds (see
+    reorder) and the shards are streamed through a k-way merge instead of
+    being loaded and sorted. Rows that arrived later than that stay out of
+    order; they are counted and reported. The merged
+    output (any earlier rows followed by the shards' rows) is built in a
+    temporary file next to the output. The manifest is then marked as merged
+    before the temporary file replaces the output and the shards are
+    removed, so running an interrupted merge again either starts over (the
+    output is untouched) or just finishes the clean-up; rows are never
+    merged twice.
+
+    :param window: Reorder window in seconds per shard (see reorder).
+    :return: Number of rows merged.
+    """
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    kind = manifest["storage"]
+    output = manifest["output"]
+    merging = output + '.merging'
+    shards = [path for path in manifest["shards"] if os.path.isfile(path)]
+
+    if "merged" not in manifest:
+        if os.path.isfile(output):
+            shutil.copyfile(output, merging)
+        elif os.path.isfile(merging):
+            os.remove(merging)
+        backend = CsvBackend(merging) if kind == 'csv' else ColumnarBackend(merging)
+        merged = 0
+        late = [0]
+        rows = heapq.merge(*(reorder(read_shard(kind, path), window, late) for path in shards),
+                           key=lambda row: row[3])
+        try:
+            while True:
+                batch = list(itertools.islice(rows, MERGE_BATCH_ROWS))
+                if not batch:
+                    break
+                backend.write_rows(batch)
+                merged += len(batch)
+        finally:
+            backend.close()
+        if late[0]:
+            print(f"Warning: {late[0]} rows arrived more than {window} s late and are out of timestamp order "
+                  f"in {output}", file=sys.stderr)
+        manifest["merged"] = merged
+        _update_manifest(manifest_file, manifest)
+
+    if os.path.isfile(merging):
+        os.replace(merging, output)
+    for path in shards:
+        os.remove(path)
+    os.remove(manifest_file)
+    return manifest["merged"]
+
+
+class ArchiveReader:
+    """Read-only, mmap-backed view of a columnar archive."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.view = memoryview(self.map)
+        if size < ARCHIVE_HEADER.size or ARCHIVE_HEADER.unpack_from(self.view)[0] != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not a PDC archive")
+        self.chunks = self._read_footers()
+
+    def _read_footers(self):
+        """Walks the footer chain backwards; returns [(start, min_ts, max_ts, rows, dict_bytes)] in file order."""
+        chunks = []
+        end = len(self.view)
+        while end > ARCHIVE_HEADER.size:
+            footer_start = end - CHUNK_FOOTER.size
+            min_ts, max_ts, rows, data_bytes, dict_bytes, magic = CHUNK_FOOTER.unpack_from(self.view, footer_start)
+            if magic != CHUNK_MAGIC:
+                raise ValueError(f"Corrupt chunk footer at offset {footer_start}")
+            start = footer_start - data_bytes
+            chunks.append((start, min_ts, max_ts, rows, dict_bytes))
+            end = start
+        chunks.reverse()
+        return chunks
+
+    def columns(self, chunk):
+        """Returns (bus_ids, codes, voltage, angle, timestamp_ns) views for one chunk from self.chunks."""
+        start, _, _, rows, dict_bytes = chunk
+        offset = start
+        timestamps = self.view[offset:offset + 8 * rows].cast('q')
+        offset += 8 * rows
+        voltages = self.view[offset:offset + 4 * rows].cast('f')
+        offset += 4 * rows
+        angles = self.view[offset:offset + 4 * rows].cast('f')
+        offset += 4 * rows
+        codes = self.view[offset:offset + 2 * rows].cast('H')
+        offset += 2 * rows
+        bus_ids = str(self.view[offset:offset + dict_bytes], 'utf-8').split('\n')
+        return bus_ids, codes, voltages, angles, timestamps
+
+    def read_range(self, start=None, end=None):
+        """
+        Yields [busID, voltage, phaseAngle, timestamp] rows with start <= timestamp <= end
+        (seconds; None means unbounded). Chunks outside the range are skipped by their footer.
+        """
+        start_ns = None if start is None else int(round(start * 1e9))
+        end_ns = None if end is None else int(round(end * 1e9))
+        for chunk in self.chunks:
+            _, min_ts, max_ts, _, _ = chunk
+            if (start_ns is not None and max_ts < start_ns) or (end_ns is not None and min_ts > end_ns):
+                continue
+            bus_ids, codes, voltages, angles, timestamps = self.columns(chunk)
+            try:
+                for i, ts in enumerate(timestamps):
+                    if (start_ns is None or ts >= start_ns) and (end_ns is None or ts <= end_ns):
+                        yield [bus_ids[codes[i]], voltages[i], angles[i], ts / 1e9]
+            finally:
+                # Release the chunk's views even if the caller stops early, so close() can unmap
+                for view in (codes, voltages, angles, timestamps):
+                    view.release()
+
+    def close(self):
+        """
+        Closes the archive. Views still held by a caller (from columns(), or a
+        read_range() generator that is suspended) keep the mapping alive until
+        they are released; the mapping is then unmapped when it is collected.
+        """
+        self.view.release()
+        if isinstance(self.map, mmap.mmap):
+            try:
+                self.map.close()
+            except BufferError:
+                pass
+        self.map = b''
+        self.file.close()
+
+
+class StorageWriter:
+    """
+    Bounded queue plus background writer thread.
+
+    put() is called on the receive thread with the rows of one datagram. When
+    the queue is full the overflow policy decides what happens:
+
+        block        wait for room (backpressure; the kernel socket buffer absorbs bursts)
+        drop-newest  discard the incoming rows
+        drop-oldest  discard the oldest queued rows to make room
+
+    The writer thread hands rows to the backend in batches of up to
+    flush_rows, and flushes the backend at least every flush_interval seconds.
+    """
+
+    def __init__(self, backend, queue_size=10000, flush_rows=512, flush_interval=1.0,
+                 overflow='block', quiet=False, summary_interval=10.0):
+        """
+        :param backend: Object with write_rows(rows), flush() and close().
+        :param queue_size: Maximum queued datagrams' worth of rows.
+        :param flush_rows: Rows collected before a batch is written.
+        :param flush_interval: Maximum seconds rows wait before being written and flushed.
+        :param overflow: One of OVERFLOW_POLICIES.
+        :param quiet: Print a periodic summary instead of one line per row.
+        :param summary_interval: Seconds between summaries in quiet mode.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}' (expected one of {', '.join(OVERFLOW_POLICIES)})")
+        self.backend = backend
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.quiet = quiet
+        self.summary_interval = summary_interval
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches = 0
+        self.blocked = 0
+        self.max_depth = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def put(self, rows, addr=None):
+        """Queues the rows of one datagram; addr is only used for per-row printing."""
+        if not rows:
+            return
+        item = (rows, addr)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow == 'block':
+                self.blocked += 1
+                self.queue.put(item)
+            elif self.overflow == 'drop-newest':
+                self.rows_dropped += len(rows)
+                return
+            else:
+                try:
+                    dropped, _ = self.queue.get_nowait()
+                    self.rows_dropped += len(dropped)
+                except queue.Empty:
+                    pass
+                try:
+                    self.queue.put_nowait(item)
+                except queue.Full:
+                    self.rows_dropped += len(rows)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _write_loop(self):
+        pending = []
+        last_flush = time.monotonic()
+        next_summary = last_flush + self.summary_interval
+        while self.running or not self.queue.empty():
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                rows, addr = self.queue.get(timeout=timeout)
+                pending.extend(rows)
+                if not self.quiet:
+                    for row in rows:
+                        print(f"Stored data from {addr}: {row}")
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if len(pending) >= self.flush_rows or (pending and now - last_flush >= self.flush_interval):
+                self._write(pending)
+                pending = []
+            if now - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = now
+            if self.quiet and now >= next_summary:
+                print(f"Storage: {self.stats()}")
+                next_summary = now + self.summary_interval
+        if pending:
+            self._write(pending)
+        self._flush()
+
+    def _write(self, rows):
+        try:
+            self.backend.write_rows(rows)
+            self.rows_written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            self.rows_dropped += len(rows)
+            print(f"Storage write failed, {len(rows)} rows lost: {e}", file=sys.stderr)
+
+    def _flush(self):
+        try:
+            self.backend.flush()
+        except Exception as e:
+            print(f"Storage flush failed: {e}", file=sys.stderr)
+
+    def stats(self):
+        return (f"{self.rows_written} rows written in {self.batches} batches, {self.rows_dropped} dropped, "
+                f"queue depth {self.queue.qsize()} (max {self.max_depth}), blocked {self.blocked} times")
+
+    def close(self):
+        """Writes everything still queued, then closes the backend."""
+        self.running = False
+        self.thread.join()
+        self.backend.close()
+
+
+if __name__ == "__main__":
+    if sys.byteorder == 'big':
+        sys.exit("Reading archives is only supported on little-endian hosts.")
+
+    parser = argparse.ArgumentParser(description="Inspect or export a PDC columnar archive.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    info_parser = subparsers.add_parser('info', help="List the chunks of an archive.")
+    info_parser.add_argument('archive', type=str)
+    export_parser = subparsers.add_parser('export', help="Write archive rows as CSV to stdout.")
+    export_parser.add_argument('archive', type=str)
+    export_parser.add_argument('--start', type=float, default=None, help="First timestamp to include (UNIX seconds).")
+    export_parser.add_argument('--end', type=float, default=None, help="Last timestamp to include (UNIX seconds).")
+    args = parser.parse_args()
+
+    reader = ArchiveReader(args.archive)
+    try:
+        if args.command == 'info':
+            total = 0
+            for i, (offset, min_ts, max_ts, rows, _) in enumerate(reader.chunks):
+                print(f"chunk {i}: offset {offset}, {rows} rows, {min_ts / 1e9:.6f} .. {max_ts / 1e9:.6f}")
+                total += rows
+            print(f"{len(reader.chunks)} chunks, {total} rows, {len(reader.view)} bytes")
+        else:
+            writer = csv.writer(sys.stdout)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(reader.read_range(args.start, args.end))
+    finally:
+        reader.close()
@@ -0,0 +1,236 @@
+"""
+Per-PMU ingest telemetry for the PDC.
+
+IngestTelemetry is fed once per received datagram and keeps, for every
+source address and every bus:
+
+    datagrams, bytes and rows received (rates are derived per snapshot)
+    parse failures (malformed lines or frames that produced no row)
+    inter-arrival jitter: |(arrival_j - arrival_i) - (stamp_j - stamp_i)|
+        between consecutive datagrams of a source (RFC 3550 style), plus
+        the smoothed jitter estimate J += (|D| - J) / 16
+    one-way latency: receive time minus measurement timestamp
+    gaps inferred from timestamps: a bus whose timestamp advances by more
+        than gap_factor times its reporting interval has missed samples
+
+Distributions go into fixed-bucket histograms (milliseconds), so memory per
+source and bus is constant. Latency relies on the PMU and PDC clocks being
+synchronised; negative values (clock skew) land in the first bucket and show
+up in "min".
+
+snapshot() returns a plain dict; dump() appends it as one JSON line, which is
+what pdc.py does every --telemetry-interval seconds when --telemetry-file is
+set.
+"""
+import json
+import time
+from bisect import bisect_left
+
+# Upper bucket bounds in milliseconds; the last bucket counts everything above.
+LATENCY_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+JITTER_BOUNDS_MS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum, min and max."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None if empty or in the overflow bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.min, 'max': self.max,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+                'bounds': list(self.bounds), 'counts': list(self.counts)}
+
+
+class SourceStats:
+    __slots__ = ('datagrams', 'bytes', 'rows', 'parse_failures', 'last_arrival', 'last_stamp',
+                 'jitter', 'jitter_ms', 'latency_ms')
+
+    def __init__(self):
+        self.datagrams = 0
+        self.bytes = 0
+        self.rows = 0
+        self.parse_failures = 0
+        self.last_arrival = None
+        self.last_stamp = None
+        self.jitter = 0.0
+        self.jitter_ms = Histogram(JITTER_BOUNDS_MS)
+        self.latency_ms = Histogram(LATENCY_BOUNDS_MS)
+
+
+class BusStats:
+    __slots__ = ('rows', 'last_stamp', 'interval', 'gaps', 'missing', 'out_of_order', 'latency_ms')
+
+    def __init__(self):
+        self.rows = 0
+        self.last_stamp = None
+        self.interval = None
+        self.gaps = 0
+        self.missing = 0
+        self.out_of_order = 0
+        self.latency_ms = Histogram(LATENCY_BOUNDS_MS)
+
+
+def source_name(source):
+    return f"{source[0]}:{source[1]}" if isinstance(source, tuple) else str(source)
+
+
+class IngestTelemetry:
+    """Counters and histograms per source address and per bus."""
+
+    def __init__(self, gap_factor=1.5, per_bus=True):
+        """
+        :param gap_factor: A timestamp step larger than this many reporting intervals counts as a gap.
+        :param per_bus: Also keep per-bus counters and latency histograms.
+        """
+        self.gap_factor = gap_factor
+        self.per_bus = per_bus
+        self.sources = {}
+        self.buses = {}
+        self.started = time.time()
+        self.last_snapshot = None
+
+    def record(self, source, nbytes, rows, parse_failures=0, now=None):
+        """
+        Records one datagram.
+
+        :param source: The sender address.
+        :param nbytes: Datagram size.
+        :param rows: Rows parsed from it, [busID, voltage, phaseAngle, timestamp].
+        :param parse_failures: Lines or frames in it that could not be parsed.
+        :param now: Receive time in UNIX seconds (defaults to time.time()).
+        """
+        now = time.time() if now is None else now
+        stats = self.sources.get(source)
+        if stats is None:
+            stats = self.sources[source] = SourceStats()
+        stats.datagrams += 1
+        stats.bytes += nbytes
+        stats.rows += len(rows)
+        stats.parse_failures += parse_failures
+        if not rows:
+            return
+
+        stamp = rows[0][3]
+        if stats.last_arrival is not None:
+            deviation = abs((now - stats.last_arrival) - (stamp - stats.last_stamp))
+            stats.jitter += (deviation - stats.jitter) / 16
+            stats.jitter_ms.observe(deviation * 1000.0)
+        stats.last_arrival = now
+        stats.last_stamp = stamp
+
+        latency_ms = stats.latency_ms
+        for row in rows:
+            latency = (now - row[3]) * 1000.0
+            latency_ms.observe(latency)
+            if self.per_bus:
+                self._record_bus(row[0], row[3], latency)
+
+    def _record_bus(self, bus_id, stamp, latency):
+        bus = self.buses.get(bus_id)
+        if bus is None:
+            bus = self.buses[bus_id] = BusStats()
+        bus.rows += 1
+        bus.latency_ms.observe(latency)
+        last = bus.last_stamp
+        if last is not None:
+            step = stamp - last
+            if step <= 0:
+                if step < 0:
+                    bus.out_of_order += 1
+                return
+            if bus.interval is None or step < bus.interval:
+                # The smallest step seen is the best estimate of the reporting interval.
+                bus.interval = step
+            elif step > self.gap_factor * bus.interval:
+                bus.gaps += 1
+                bus.missing += round(step / bus.interval) - 1
+        bus.last_stamp = stamp
+
+    def snapshot(self, now=None):
+        """Returns the current counters as a JSON-serialisable dict, with rates since the previous snapshot."""
+        now = time.time() if now is None else now
+        previous = self.last_snapshot
+        elapsed = now - (previous['time'] if previous else self.started)
+        previous_sources = previous['sources'] if previous else {}
+
+        sources = {}
+        for source, stats in self.sources.items():
+            name = source_name(source)
+            before = previous_sources.get(name, {})
+            sources[name] = {
+                'datagrams': stats.datagrams,
+                'bytes': stats.bytes,
+                'rows': stats.rows,
+                'parse_failures': stats.parse_failures,
+                'frames_per_s': (stats.datagrams - before.get('datagrams', 0)) / elapsed if elapsed > 0 else None,
+                'bytes_per_s': (stats.bytes - before.get('bytes', 0)) / elapsed if elapsed > 0 else None,
+                'jitter_ms': stats.jitter * 1000.0,
+                'jitter_hist_ms': stats.jitter_ms.to_dict(),
+                'latency_ms': stats.latency_ms.to_dict(),
+            }
+
+        buses = {}
+        for bus_id, bus in self.buses.items():
+            buses[bus_id] = {
+                'rows': bus.rows,
+                'interval': bus.interval,
+                'gaps': bus.gaps,
+                'missing': bus.missing,
+                'out_of_order': bus.out_of_order,
+                'last_timestamp': bus.last_stamp,
+                'latency_ms': bus.latency_ms.to_dict(),
+            }
+
+        snapshot = {'time': now, 'interval': elapsed, 'sources': sources, 'buses': buses}
+        self.last_snapshot = snapshot
+        return snapshot
+
+    def dump(self, path, now=None):
+        """Appends a snapshot to path as one JSON line and returns it."""
+        snapshot = self.snapshot(now)
+        with open(path, 'a') as f:
+            f.write(json.dumps(snapshot) + '\n')
+        return snapshot
+
+    def summary(self):
+        """One-line human-readable summary."""
+        failures = sum(stats.parse_failures for stats in self.sources.values())
+        gaps = sum(bus.gaps for bus in self.buses.values())
+        missing = sum(bus.missing for bus in self.buses.values())
+        worst = max((stats.latency_ms.max for stats in self.sources.values() if stats.latency_ms.max is not None),
+                    default=None)
+        return (f"{len(self.sources)} sources, {len(self.buses)} buses, {failures} parse failures, "
+                f"{gaps} gaps ({missing} samples missing), max latency "
+                + (f"{worst:.1f} ms" if worst is not None else "n/a"))
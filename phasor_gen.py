@@ -0,0 +1,161 @@
+"""
+Synthetic, time-varying phasors for the PMU simulator.
+
+Every bus is advanced in one vectorized NumPy step per reporting instant, so
+the cost per tick does not grow with a Python loop over buses. The model is
+deliberately simple but produces data that actually changes:
+
+    * system frequency wanders around nominal (Ornstein-Uhlenbeck process) and
+      the accumulated frequency error rotates every bus angle together;
+    * electromechanical oscillation modes add sinusoidal swings with a
+      per-bus mode shape;
+    * step events (faults, load/generation changes) hit random buses and
+      decay back towards the base value;
+    * Gaussian measurement noise is added on top.
+
+Used by pmu.py when started with --synthetic.
+"""
+import threading
+
+import numpy as np
+
+# (frequency Hz, angle amplitude in degrees, voltage amplitude in p.u.)
+DEFAULT_MODES = [
+    (0.25, 1.5, 0.002),   # inter-area
+    (1.2, 0.6, 0.001),    # local
+]
+
+
+class PhasorGenerator:
+    """Time-varying voltage magnitude/angle for a fixed set of buses."""
+
+    def __init__(self, bus_ids, base_voltage, base_angle, seed=None, nominal_frequency=60.0,
+                 frequency_deviation=0.02, frequency_time_constant=30.0, modes=DEFAULT_MODES,
+                 step_rate=0.02, step_size=0.03, step_time_constant=5.0,
+                 voltage_noise=0.0005, angle_noise=0.02):
+        """
+        :param bus_ids: Bus names, e.g. ['B1', 'B2', ...].
+        :param base_voltage: Base voltage magnitude per bus (p.u.).
+        :param base_angle: Base phase angle per bus (degrees).
+        :param seed: Seed for the random generator; the same seed reproduces the same data.
+        :param nominal_frequency: Nominal system frequency in Hz (reported by frequency()).
+        :param frequency_deviation: Standard deviation of the frequency error in Hz.
+        :param frequency_time_constant: How quickly the frequency error reverts to nominal (s).
+        :param modes: List of (frequency Hz, angle amplitude deg, voltage amplitude p.u.) oscillation modes.
+        :param step_rate: Expected step events per second across all buses.
+        :param step_size: Standard deviation of a voltage step (p.u.); the angle step is 10x in degrees.
+        :param step_time_constant: Decay time constant of a step back to base (s).
+        :param voltage_noise: Standard deviation of voltage measurement noise (p.u.).
+        :param angle_noise: Standard deviation of angle measurement noise (degrees).
+        """
+        self.bus_ids = list(bus_ids)
+        self.index = {bus_id: i for i, bus_id in enumerate(self.bus_ids)}
+        n = len(self.bus_ids)
+
+        self.rng = np.random.default_rng(seed)
+        self.base_voltage = np.asarray(base_voltage, dtype=np.float64)
+        self.base_angle = np.asarray(base_angle, dtype=np.float64)
+        self.nominal_frequency = nominal_frequency
+        self.frequency_deviation = frequency_deviation
+        self.frequency_time_constant = frequency_time_constant
+        self.step_rate = step_rate
+        self.step_size = step_size
+        self.step_time_constant = step_time_constant
+        self.voltage_noise = voltage_noise
+        self.angle_noise = angle_noise
+
+        modes = np.asarray(modes, dtype=np.float64).reshape(-1, 3)
+        self.mode_frequency = modes[:, 0:1]
+        # Mode shapes: how strongly and with which phase each bus takes part in each mode.
+        participation = self.rng.uniform(0.2, 1.0, size=(len(modes), n))
+        self.mode_angle_amplitude = modes[:, 1:2] * participation
+        self.mode_voltage_amplitude = modes[:, 2:3] * participation
+        self.mode_phase = self.rng.uniform(0, 2 * np.pi, size=(len(modes), n))
+
+        self.frequency_error = 0.0
+        self.rotation = 0.0
+        self.voltage_step = np.zeros(n)
+        self.angle_step = np.zeros(n)
+        self.last_time = None
+        self.voltage = self.base_voltage.copy()
+        self.angle = self.base_angle.copy()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_bus_data(cls, bus_data, extra_bus_ids=(), **kwargs):
+        """
+        Builds a generator whose base values come from a bus_data table.
+
+        Buses in extra_bus_ids that are not in the table get a base of 1.0 p.u. and 0 degrees.
+        """
+        bus_ids = list(bus_data) + [bus_id for bus_id in extra_bus_ids if bus_id not in bus_data]
+        base_voltage = [bus_data[b]["voltage"] if b in bus_data else 1.0 for b in bus_ids]
+        base_angle = [bus_data[b]["phaseAngle"] if b in bus_data else 0.0 for b in bus_ids]
+        return cls(bus_ids, base_voltage, base_angle, **kwargs)
+
+    def __contains__(self, bus_id):
+        return bus_id in self.index
+
+    def __len__(self):
+        return len(self.bus_ids)
+
+    def frequency(self):
+        """Current system frequency in Hz."""
+        return self.nominal_frequency + self.frequency_error
+
+    def advance(self, t):
+        """
+        Advances every bus to time t (UNIX seconds) in one vectorized step.
+
+        Calls with a time that is not later than the previous one return the
+        cached state, so PMUs reporting on the same instant see the same values.
+        """
+        with self.lock:
+            if self.last_time is not None:
+                if t <= self.last_time:
+                    return self.voltage, self.angle
+                self._step(t - self.last_time)
+            self.last_time = t
+
+            n = len(self.bus_ids)
+            swing = np.sin(2 * np.pi * self.mode_frequency * t + self.mode_phase)
+            angle = (self.base_angle + self.rotation + self.angle_step
+                     + (self.mode_angle_amplitude * swing).sum(axis=0)
+                     + self.rng.normal(0.0, self.angle_noise, n))
+            self.angle = (angle + 180.0) % 360.0 - 180.0
+            self.voltage = (self.base_voltage + self.voltage_step
+                            + (self.mode_voltage_amplitude * swing).sum(axis=0)
+                            + self.rng.normal(0.0, self.voltage_noise, n))
+            return self.voltage, self.angle
+
+    def _step(self, dt):
+        # Frequency error: exact discretization of an Ornstein-Uhlenbeck process.
+        decay = np.exp(-dt / self.frequency_time_constant)
+        self.frequency_error = (self.frequency_error * decay
+                                + self.frequency_deviation * np.sqrt(1 - decay * decay) * self.rng.normal())
+        self.rotation = (self.rotation + 360.0 * self.frequency_error * dt) % 360.0
+
+        step_decay = np.exp(-dt / self.step_time_constant)
+        self.voltage_step *= step_decay
+        self.angle_step *= step_decay
+        events = self.rng.poisson(self.step_rate * dt)
+        if events:
+            buses = self.rng.integers(0, len(self.bus_ids), size=events)
+            sizes = self.rng.normal(0.0, self.step_size, size=events)
+            np.add.at(self.voltage_step, buses, sizes)
+            np.add.at(self.angle_step, buses, 10.0 * sizes)
+
+    def indices(self, bus_ids):
+        """Array of generator slots for bus_ids, for use with measure."""
+        return np.fromiter((self.index[bus_id] for bus_id in bus_ids), dtype=np.intp, count=len(bus_ids))
+
+    def measure(self, bus_ids, timestamp, indices=None):
+        """
+        Returns [(bus_id, voltage, phaseAngle), ...] for bus_ids at timestamp.
+
+        :param indices: Optional precomputed result of indices(bus_ids).
+        """
+        if indices is None:
+            indices = self.indices(bus_ids)
+        voltage, angle = self.advance(timestamp)
+        return list(zip(bus_ids, voltage[indices].tolist(), angle[indices].tolist()))
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 import socket
 import time
+import math
+import heapq
+import threading
+from fractions import Fraction
 import argparse
 import sys
 import json
+import pmu_frames
 
 bus_data = {
     "B1": {"voltage": 1.02, "phaseAngle": -5.3},
@@ -50,57 +55,369 @@ def load_config(config_file):
         print(f"Error: Could not decode JSON from '{config_file}'", file=sys.stderr)
         return None
 
-def pmu_send(pdc_ip, pdc_port, bus_ids, interval):
+class StaticSource:
+    """Constant phasors from the bus_data table."""
+
+    def __contains__(self, bus_id):
+        return bus_id in bus_data
+
+    def indices(self, bus_ids):
+        """The table is looked up by bus ID; nothing to precompute (see PhasorGenerator.indices)."""
+        return None
+
+    def measure(self, bus_ids, timestamp, indices=None):
+        """Returns [(bus_id, voltage, phaseAngle), ...] for bus_ids."""
+        return [(bus_id, bus_data[bus_id]["voltage"], bus_data[bus_id]["phaseAngle"]) for bus_id in bus_ids]
+
+def make_source(synthetic=False, seed=None, bus_ids=()):
+    """
+    Returns the phasor source PMUs read from: the static bus_data table, or a
+    phasor_gen.PhasorGenerator (requires NumPy) when synthetic is set.
+
+    :param bus_ids: Bus IDs outside bus_data that the generator should also model.
+    """
+    if not synthetic:
+        return StaticSource()
+    import phasor_gen
+    return phasor_gen.PhasorGenerator.from_bus_data(bus_data, extra_bus_ids=bus_ids, seed=seed)
+
+def format_measurement(bus_id, voltage, angle, timestamp):
+    """Formats one bus measurement as a line of the text protocol."""
+    return f"busID: {bus_id} voltage: {voltage} phaseAngle: {angle} timestamp: {timestamp}\n"
+
+def build_text_frame(measurements, timestamp):
+    """
+    Packs all buses of one reporting instant into a single datagram.
+
+    The frame is one text-protocol line per bus, all sharing the same
+    timestamp, so a PDC that splits datagrams on newlines reads it as-is.
+
+    :param measurements: (bus_id, voltage, phaseAngle) tuples to include.
+    :param timestamp: The reporting instant shared by every bus in the frame.
+    """
+    return ''.join(format_measurement(bus_id, voltage, angle, timestamp)
+                   for bus_id, voltage, angle in measurements).encode('utf-8')
+
+def build_binary_frame(pmu_id, measurements, timestamp):
+    """Packs all buses of one reporting instant into a binary data frame (see pmu_frames)."""
+    return pmu_frames.encode_frame(
+        pmu_id, timestamp,
+        ((pmu_frames.bus_number(bus_id), voltage, angle) for bus_id, voltage, angle in measurements))
+
+def sleep_until(deadline, spin=0.0):
+    """Sleeps until wall-clock time deadline, busy-waiting for the last spin seconds."""
+    remaining = deadline - time.time()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while time.time() < deadline:
+        pass
+
+class FrameScheduler:
+    """
+    Absolute-deadline reporting clock.
+
+    Frame k is due at exactly k / frame_rate seconds of wall-clock time, so
+    frames stay on aligned boundaries no matter how long each send takes, and
+    PMUs running at the same rate report on the same instants. Fractional
+    rates such as 30000/1001 are kept exact as a Fraction.
+    """
+
+    def __init__(self, frame_rate, spin=0.0002):
+        """
+        :param frame_rate: Frames per second (number, Fraction or string like '30000/1001').
+        :param spin: Seconds before each deadline to stop sleeping and busy-wait instead,
+            which hides the coarse wake-up granularity of time.sleep.
+        """
+        # A float is taken at its decimal value (29.97 -> 2997/100), not its binary expansion;
+        # anything else is kept exact, so slow rates such as 1/3600 survive.
+        self.frame_rate = Fraction(str(frame_rate)) if isinstance(frame_rate, float) else Fraction(frame_rate)
+        if self.frame_rate <= 0:
+            raise ValueError(f"Frame rate must be positive, got {frame_rate}")
+        self.period = float(1 / self.frame_rate)
+        self.spin = spin
+        self.next_index = self._index_at(time.time()) + 1
+        self.current_deadline = None
+        self.frames = 0
+        self.missed = 0
+        self.overruns = 0
+        self.max_lateness = 0.0
+
+    def _index_at(self, t):
+        """Index of the last frame due at or before time t."""
+        return math.floor(t * self.frame_rate.numerator / self.frame_rate.denominator)
+
+    def deadline(self, index):
+        return index * self.frame_rate.denominator / self.frame_rate.numerator
+
+    def peek(self):
+        """
+        Returns the deadline of the next frame to send.
+
+        If whole frames have already gone by (the process was descheduled or a
+        send overran), they are skipped and counted as missed rather than sent
+        late in a burst.
+        """
+        latest_due = self._index_at(time.time())
+        if latest_due > self.next_index:
+            self.missed += latest_due - self.next_index
+            self.next_index = latest_due
+        return self.deadline(self.next_index)
+
+    def begin(self, deadline):
+        """Marks the frame due at deadline as being sent."""
+        self.max_lateness = max(self.max_lateness, time.time() - deadline)
+        self.current_deadline = deadline
+        self.next_index += 1
+        self.frames += 1
+
+    def wait(self):
+        """Sleeps until the next frame is due and returns its aligned timestamp."""
+        deadline = self.peek()
+        sleep_until(deadline, self.spin)
+        self.begin(deadline)
+        return deadline
+
+    def finish(self):
+        """Marks the current frame as sent; counts an overrun if it ran past the next deadline."""
+        if self.current_deadline is not None and time.time() - self.current_deadline > self.period:
+            self.overruns += 1
+
+    def stats(self):
+        return (f"{self.frames} frames at {float(self.frame_rate):g} fps, {self.missed} missed deadlines, "
+                f"{self.overruns} overruns, max lateness {self.max_lateness * 1000:.3f} ms")
+
+class PmuSender:
+    """One simulated PMU: its own UDP socket, PDC destination, buses and reporting clock."""
+
+    def __init__(self, name, pdc_ip, pdc_port, bus_ids, frame_rate, batch=False, wire_format='text',
+                 pmu_id=0, source_ip=None, source=None):
+        """
+        :param name: PMU name, used in log messages.
+        :param pdc_ip: The IP address of the PDC (destination).
+        :param pdc_port: The port number of the PDC.
+        :param bus_ids: A list of bus IDs this PMU instance should monitor.
+        :param frame_rate: Reporting rate in frames per second.
+        :param batch: Send all buses of a reporting interval as one frame instead of one datagram per bus.
+        :param wire_format: 'text' for the line protocol or 'binary' for pmu_frames data frames.
+            Binary frames always carry every bus of the interval.
+        :param pmu_id: Numeric PMU id written into binary frames.
+        :param source_ip: Optional local address to bind the socket to.
+        :param source: Where phasor values come from (StaticSource or a PhasorGenerator);
+            defaults to the static bus_data table.
+        """
+        self.source = source if source is not None else StaticSource()
+        for bus_id in bus_ids:
+            if bus_id not in self.source:
+                print(f"Warning: Bus ID '{bus_id}' not found in database for {name}. Skipping.", file=sys.stderr)
+        self.name = name
+        self.destination = (pdc_ip, pdc_port)
+        self.bus_ids = [bus_id for bus_id in bus_ids if bus_id in self.source]
+        # Generator slots of the buses, looked up once instead of on every frame
+        self.indices = self.source.indices(self.bus_ids)
+        self.batch = batch
+        self.wire_format = wire_format
+        self.pmu_id = pmu_id
+        self.scheduler = FrameScheduler(frame_rate)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if source_ip:
+            self.socket.bind((source_ip, 0))
+
+    def describe(self):
+        if self.wire_format == 'binary':
+            mode = f"binary frames, PMU id {self.pmu_id}"
+        else:
+            mode = "batched frames" if self.batch else "one datagram per bus"
+        return f"{self.destination[0]}:{self.destination[1]} ({mode}, {float(self.scheduler.frame_rate):g} fps)"
+
+    def send(self, timestamp):
+        """Sends every bus of the frame due at timestamp."""
+        measurements = self.source.measure(self.bus_ids, timestamp, self.indices)
+        if self.wire_format == 'binary':
+            self.socket.sendto(build_binary_frame(self.pmu_id, measurements, timestamp), self.destination)
+        elif self.batch:
+            self.socket.sendto(build_text_frame(measurements, timestamp), self.destination)
+        else:
+            for bus_id, voltage, angle in measurements:
+                message = format_measurement(bus_id, voltage, angle, timestamp)
+                self.socket.sendto(message.encode('utf-8'), self.destination)
+                #print(f"Sent data for {bus_id}")
+
+    def close(self):
+        self.socket.close()
+
+def interval_to_frame_rate(interval, frame_rate=None):
+    """Returns frame_rate if set, otherwise the rate matching a period of interval seconds."""
+    return frame_rate if frame_rate else Fraction(1) / Fraction(str(interval))
+
+def pmu_send(pdc_ip, pdc_port, bus_ids, interval, batch=False, wire_format='text', pmu_id=0, frame_rate=None,
+             source=None):
     """
     :param pdc_ip: The IP address of the PDC (destination).
     :param pdc_port: The port number of the PDC.
     :param bus_ids: A list of bus IDs this PMU instance should monitor.
-    :param interval: The time to wait between sending each batch of measurements.
+    :param interval: Reporting period in seconds, used when frame_rate is not given.
+    :param batch: Send all buses of a reporting interval as one frame instead of one datagram per bus.
+    :param wire_format: 'text' for the line protocol or 'binary' for pmu_frames data frames.
+        Binary frames always carry every bus of the interval.
+    :param pmu_id: Numeric PMU id written into binary frames.
+    :param frame_rate: Reporting rate in frames per second; overrides interval.
+    :param source: Phasor source (see make_source); defaults to the static bus_data table.
     """
-    pmu_socket = None
+    sender = None
 
     try:
-        pmu_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        print(f"UDP PMU client ready to send to PDC at {pdc_ip}:{pdc_port}")
+        sender = PmuSender(f"pmu{pmu_id}", pdc_ip, pdc_port, bus_ids, interval_to_frame_rate(interval, frame_rate),
+                           batch=batch, wire_format=wire_format, pmu_id=pmu_id, source=source)
+        print(f"UDP PMU client ready to send to PDC at {sender.describe()}")
 
         while True:
-            for bus_id in bus_ids:
-                if bus_id not in bus_data:
-                    print(f"Warning: Bus ID '{bus_id}' not found in database. Skipping.", file=sys.stderr)
-                    continue
-
-                data = bus_data[bus_id]
-                voltage = data["voltage"]
-                angle = data["phaseAngle"]
-                timestamp = time.time()
-
-                message = f"busID: {bus_id} voltage: {voltage} phaseAngle: {angle} timestamp: {timestamp}\n"
-                
-                pmu_socket.sendto(message.encode('utf-8'), (pdc_ip, pdc_port))
-                #print(f"Sent data for {bus_id}")
-            
-            #print(f"--- Batch complete. Waiting for {interval} second(s)... ---")
-            time.sleep(interval)
+            timestamp = sender.scheduler.wait()
+            sender.send(timestamp)
+            sender.scheduler.finish()
 
     except KeyboardInterrupt:
         print("\n--- PMU Stopped by user ---")
+        if sender:
+            print(f"Scheduler: {sender.scheduler.stats()}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}", file=sys.stderr)
     finally:
-        if pmu_socket:
+        if sender:
             print("Closing UDP socket.")
-            pmu_socket.close()
+            sender.close()
+
+def run_senders(senders, stop, spin=0.0002):
+    """
+    Drives many PMUs from one thread.
+
+    Senders are kept in a heap ordered by their next deadline; the loop sleeps
+    until the earliest one is due, sends it and reschedules it. PMUs sharing a
+    frame rate share deadlines, so they go out back to back on one wake-up.
+    The loop exits once the stop event is set.
+    """
+    heap = [(sender.scheduler.peek(), i) for i, sender in enumerate(senders)]
+    heapq.heapify(heap)
+    while heap and not stop.is_set():
+        deadline, i = heapq.heappop(heap)
+        sender = senders[i]
+        sleep_until(deadline, spin)
+        sender.scheduler.begin(deadline)
+        sender.send(deadline)
+        sender.scheduler.finish()
+        heapq.heappush(heap, (sender.scheduler.peek(), i))
+
+def config_pmu_names(config):
+    """Every PMU entry of pmu_config.json (all keys except global_settings and default)."""
+    return [name for name in config if name not in ("global_settings", "default")]
+
+def pmu_id_stride(names):
+    """Spacing of the PMU ids of successive copies: one more than the highest configured PMU number."""
+    return max((pmu_frames.pmu_number(name) for name in names), default=0) + 1
+
+def max_copies(names):
+    """Most copies of names whose PMU ids still fit the 16-bit pmu_id of binary frames."""
+    return (pmu_frames.MAX_PMU_ID + 1) // pmu_id_stride(names)
+
+def build_senders(config, names=None, copies=1, synthetic=False, seed=None, **overrides):
+    """
+    Creates a PmuSender for every pmuN entry of pmu_config.json.
+
+    :param config: The loaded pmu_config.json.
+    :param names: PMU names to run; defaults to every entry except global_settings and default.
+    :param copies: Instances of each PMU to create. Copy k of pmuN reports as PMU id k * S + N, where S
+        is one more than the highest configured N, so the PDCs see them as separate PMUs.
+    :raises ValueError: If the ids of that many copies do not fit 16 bits (see max_copies).
+    :param synthetic: Read phasors from one shared PhasorGenerator instead of the static table.
+        All PMUs reporting on the same instant then see one vectorized step of the whole system.
+    :param seed: Seed for the synthetic generator.
+    :param overrides: Settings that replace the per-PMU values (e.g. frame_rate, wire_format).
+    """
+    global_config = config.get("global_settings", {})
+    if names is None:
+        names = config_pmu_names(config)
+    if copies > max_copies(names):
+        raise ValueError(f"{copies} copies of {len(names)} PMUs do not fit 16-bit PMU ids "
+                         f"(at most {max_copies(names)} copies)")
+    stride = pmu_id_stride(names)
+    all_buses = [bus_id for name in names
+                 for bus_id in config.get(name, config.get('default', {})).get('buses', global_config.get('buses', []))]
+    source = make_source(synthetic, seed, all_buses)
+
+    senders = []
+    for copy in range(copies):
+        for name in names:
+            host_config = config.get(name, config.get('default', {}))
+
+            def setting(key, default=None):
+                return host_config.get(key, global_config.get(key, default))
+
+            pmu_id = copy * stride + pmu_frames.pmu_number(name)
+            frame_rate = overrides.get('frame_rate') or interval_to_frame_rate(setting('interval'), setting('frame_rate'))
+            senders.append(PmuSender(
+                name if copy == 0 else f"{name}#{copy}",
+                setting('pdc_ip'), setting('pdc_port'), setting('buses', []), frame_rate,
+                batch=overrides.get('batch', setting('batch', False)),
+                wire_format=overrides.get('wire_format') or setting('format', 'text'),
+                pmu_id=pmu_id,
+                source_ip=setting('source_ip'),
+                source=source))
+    return senders
+
+def pmu_send_all(config, names=None, copies=1, threads=1, synthetic=False, seed=None, **overrides):
+    """
+    Runs every configured PMU in this process.
+
+    :param threads: Number of sender threads; PMUs are spread round-robin across them.
+    See build_senders for the other parameters.
+    """
+    senders = []
+    workers = []
+    stop = threading.Event()
+    try:
+        senders = build_senders(config, names=names, copies=copies, synthetic=synthetic, seed=seed, **overrides)
+        print(f"Simulating {len(senders)} PMUs on {threads} thread(s)")
+        for sender in senders[:20]:
+            print(f"  {sender.name} -> {sender.describe()}")
+        if len(senders) > 20:
+            print(f"  ... and {len(senders) - 20} more")
+
+        for t in range(threads):
+            worker = threading.Thread(target=run_senders, args=(senders[t::threads], stop), daemon=True)
+            worker.start()
+            workers.append(worker)
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(1)
+
+    except KeyboardInterrupt:
+        print("\n--- PMU simulator stopped by user ---")
+        frames = sum(sender.scheduler.frames for sender in senders)
+        missed = sum(sender.scheduler.missed for sender in senders)
+        overruns = sum(sender.scheduler.overruns for sender in senders)
+        print(f"Scheduler: {frames} frames, {missed} missed deadlines, {overruns} overruns")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}", file=sys.stderr)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=5)
+        for sender in senders:
+            sender.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="PMU Simulator. Must be launched with --name.",
+        description="PMU Simulator. Must be launched with --name, or with --all to run every configured PMU.",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
 
     parser.add_argument('--name',
                         type=str,
-                        required=True,
                         help="The unique name of this node (e.g., 'pmu1'). Used to get settings from pmu_config.json.")
+    parser.add_argument('--all', action='store_true',
+                        help="Run every PMU in pmu_config.json from this one process.")
+    parser.add_argument('--synthetic', action=argparse.BooleanOptionalAction, default=None,
+                        help="Send time-varying phasors from phasor_gen (requires NumPy) instead of the static table.")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed for the synthetic phasor generator.")
 
     args, _ = parser.parse_known_args()
     hostname = args.name
@@ -110,12 +427,47 @@ if __name__ == "__main__":
         sys.exit(1)
 
     global_config = config.get("global_settings", {})
+    synthetic = args.synthetic if args.synthetic is not None else global_config.get('synthetic', False)
+    seed = args.seed if args.seed is not None else global_config.get('seed')
+
+    if args.all:
+        parser.add_argument('--names', type=str, default=None,
+                            help="Comma-separated subset of PMUs to run (default: all).")
+        parser.add_argument('--copies', type=int, default=1,
+                            help="Instances of each configured PMU, for load testing.")
+        parser.add_argument('--threads', type=int, default=1,
+                            help="Sender threads to spread the PMUs across.")
+        parser.add_argument('--frame-rate', type=Fraction, default=None,
+                            help="Override every PMU's reporting rate (frames per second).")
+        parser.add_argument('--batch', action=argparse.BooleanOptionalAction, default=None,
+                            help="Override every PMU's batch setting.")
+        parser.add_argument('--format', type=str, choices=['text', 'binary'], default=None,
+                            help="Override every PMU's wire format.")
+        args = parser.parse_args()
+
+        overrides = {'frame_rate': args.frame_rate, 'wire_format': args.format}
+        if args.batch is not None:
+            overrides['batch'] = args.batch
+        names = args.names.split(',') if args.names else None
+        if args.copies > max_copies(names or config_pmu_names(config)):
+            parser.error(f"--copies {args.copies} does not fit 16-bit PMU ids; at most "
+                         f"{max_copies(names or config_pmu_names(config))} copies of these PMUs")
+        pmu_send_all(config, names=names, copies=args.copies, threads=max(1, args.threads),
+                     synthetic=synthetic, seed=seed, **overrides)
+        sys.exit(0)
+
+    if not hostname:
+        parser.error("--name is required unless --all is given")
+
     host_config = config.get(hostname, config.get('default', {}))
 
     default_ip = host_config.get('pdc_ip', global_config.get('pdc_ip'))
     default_port = host_config.get('pdc_port', global_config.get('pdc_port'))
     default_buses = host_config.get('buses', global_config.get('buses', []))
     default_interval = host_config.get('interval', global_config.get('interval'))
+    default_batch = host_config.get('batch', global_config.get('batch', False))
+    default_format = host_config.get('format', global_config.get('format', 'text'))
+    default_frame_rate = host_config.get('frame_rate', global_config.get('frame_rate'))
 
     parser.add_argument('--ip', type=str, default=default_ip,
                         help="PDC IP address.")
@@ -125,6 +477,12 @@ if __name__ == "__main__":
                         help="Comma-separated list of Bus IDs.")
     parser.add_argument('--interval', type=float, default=default_interval,
                         help="Sending interval in seconds.")
+    parser.add_argument('--frame-rate', type=Fraction, default=default_frame_rate,
+                        help="Reporting rate in frames per second (e.g. 60 or 30000/1001). Overrides --interval.")
+    parser.add_argument('--batch', action=argparse.BooleanOptionalAction, default=default_batch,
+                        help="Send all buses of one reporting interval in a single datagram.")
+    parser.add_argument('--format', type=str, choices=['text', 'binary'], default=default_format,
+                        help="Wire format: text lines or binary C37.118-style data frames.")
 
     args = parser.parse_args()
 
@@ -134,4 +492,6 @@ if __name__ == "__main__":
         sys.exit(1)
 
     buses_to_monitor = args.buses.split(',')
-    pmu_send(args.ip, args.port, buses_to_monitor, args.interval)
\ No newline at end of file
+    pmu_send(args.ip, args.port, buses_to_monitor, args.interval, batch=args.batch,
+             wire_format=args.format, pmu_id=pmu_frames.pmu_number(hostname),
+             frame_rate=args.frame_rate, source=make_source(synthetic, seed, buses_to_monitor))
\ No newline at end of file
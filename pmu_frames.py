@@ -0,0 +1,110 @@
+"""
+Binary PMU data frames, loosely modelled on IEEE C37.118 data frames.
+
+Every field is in network byte order:
+
+    sync        u8    0xAA, never the first byte of a text message
+    version     u8    frame format version
+    frame_size  u16   total frame length in bytes, CRC included
+    pmu_id      u16   numeric PMU id (pmu6 -> 6)
+    soc         u32   second of century (UNIX seconds)
+    fracsec     u32   fraction of second in units of 1/TIME_BASE
+    bus_count   u16   number of phasors that follow
+    phasors           bus_count x (bus_id u16, voltage f32, phaseAngle f32)
+    crc         u16   CRC-CCITT of every preceding byte
+
+Shared by pmu.py (encoder) and pdc.py (decoder).
+"""
+import binascii
+import struct
+
+SYNC = 0xAA
+VERSION = 1
+TIME_BASE = 1000000
+MAX_PMU_ID = 0xFFFF
+
+HEADER = struct.Struct('!BBHHIIH')
+PHASOR = struct.Struct('!Hff')
+CRC = struct.Struct('!H')
+
+
+class FrameError(ValueError):
+    """Raised when a datagram is not a valid binary PMU frame."""
+
+
+def crc_ccitt(data):
+    """CRC-CCITT (0x1021, initial value 0xFFFF) as used by C37.118."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+def bus_number(bus_id):
+    """Maps a bus name like 'B15' to its numeric id (15)."""
+    return int(bus_id.lstrip('B'))
+
+def pmu_number(name):
+    """Maps a PMU name like 'pmu6' to its numeric id (6); 0 if it has none."""
+    digits = ''.join(c for c in name if c.isdigit())
+    return int(digits) if digits else 0
+
+def is_binary_frame(data):
+    """True if the datagram starts with the binary frame sync byte."""
+    return len(data) > 0 and data[0] == SYNC
+
+def split_timestamp(timestamp):
+    """Splits a UNIX timestamp into (soc, fracsec)."""
+    soc = int(timestamp)
+    fracsec = int(round((timestamp - soc) * TIME_BASE))
+    if fracsec >= TIME_BASE:
+        soc += 1
+        fracsec -= TIME_BASE
+    return soc, fracsec
+
+def encode_frame(pmu_id, timestamp, phasors):
+    """
+    Builds one binary data frame.
+
+    :param pmu_id: Numeric id of the sending PMU.
+    :param timestamp: Reporting instant shared by every phasor (UNIX seconds).
+    :param phasors: Iterable of (bus_number, voltage, phaseAngle) tuples.
+    :return: The encoded frame as bytes.
+    """
+    phasors = list(phasors)
+    frame_size = HEADER.size + PHASOR.size * len(phasors) + CRC.size
+    soc, fracsec = split_timestamp(timestamp)
+
+    frame = bytearray(frame_size)
+    HEADER.pack_into(frame, 0, SYNC, VERSION, frame_size, pmu_id, soc, fracsec, len(phasors))
+    offset = HEADER.size
+    for bus, voltage, angle in phasors:
+        PHASOR.pack_into(frame, offset, bus, voltage, angle)
+        offset += PHASOR.size
+    CRC.pack_into(frame, offset, crc_ccitt(memoryview(frame)[:offset]))
+    return bytes(frame)
+
+def decode_frame(data):
+    """
+    Decodes one binary data frame without copying or text decoding.
+
+    :param data: A bytes-like object holding exactly one frame.
+    :return: A list of [busID, voltage, phaseAngle, timestamp] rows.
+    :raises FrameError: If the frame is truncated, of an unknown version or fails its CRC.
+    """
+    view = memoryview(data)
+    if len(view) < HEADER.size + CRC.size:
+        raise FrameError(f"Frame too short ({len(view)} bytes)")
+
+    sync, version, frame_size, pmu_id, soc, fracsec, bus_count = HEADER.unpack_from(view)
+    if sync != SYNC:
+        raise FrameError(f"Bad sync byte 0x{sync:02x}")
+    if version != VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    if frame_size != len(view) or frame_size != HEADER.size + PHASOR.size * bus_count + CRC.size:
+        raise FrameError(f"Frame size mismatch (header says {frame_size}, got {len(view)} bytes)")
+
+    body = view[:frame_size - CRC.size]
+    (crc,) = CRC.unpack_from(view, frame_size - CRC.size)
+    if crc != crc_ccitt(body):
+        raise FrameError("CRC mismatch")
+
+    timestamp = soc + fracsec / TIME_BASE
+    return [[f"B{bus}", voltage, angle, timestamp]
+            for bus, voltage, angle in PHASOR.iter_unpack(body[HEADER.size:])]
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Low-overhead P4Runtime request log.
+
+p4runtime_lib's GrpcRequestLogger opens the dump file, renders the request
+in protobuf text format and writes it synchronously on every call, which
+puts file I/O and text formatting in front of every failover write.
+AsyncRequestLogger is a drop-in gRPC interceptor that only puts the request
+on a bounded queue; a background thread serializes it and appends it to a
+binary log:
+
+    header   b'P4LG', version (u8)
+    record   length (u32) of the rest, timestamp (u64, ns since the epoch),
+             method length (u16), method, serialized request
+
+Requests that are already bytes (see runtime_functions.PrecompiledWrites)
+are written as they are. When the queue is full, requests are dropped and
+counted rather than slowing the caller down.
+
+Run this module to convert a binary log back to the text format of the
+original dump:
+
+    python3 proto_log.py logs/s1-p4runtime-requests.bin > s1-requests.txt
+"""
+import argparse
+import datetime
+import queue
+import struct
+import sys
+import threading
+import time
+
+import grpc
+
+HEADER = struct.Struct('!4sB')
+LOG_MAGIC = b'P4LG'
+LOG_VERSION = 1
+RECORD = struct.Struct('!IQH')
+
+
+class AsyncRequestLogger(grpc.UnaryUnaryClientInterceptor,
+                         grpc.UnaryStreamClientInterceptor):
+    """gRPC interceptor that logs requests to a binary file from a background thread."""
+
+    def __init__(self, log_file, queue_size=4096, batch=256):
+        """
+        :param log_file: Binary log file; it is truncated.
+        :param queue_size: Requests that may wait for the writer before new ones are dropped.
+        :param batch: Most requests written per write() call.
+        """
+        self.log_file = log_file
+        self.batch = batch
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.logged = 0
+        self.dropped = 0
+        self.file = open(log_file, 'wb')
+        self.file.write(HEADER.pack(LOG_MAGIC, LOG_VERSION))
+        self.file.flush()
+        self.thread = threading.Thread(target=self._run, name="proto-log", daemon=True)
+        self.thread.start()
+
+    def log_message(self, method_name, body):
+        try:
+            self.queue.put_nowait((time.time_ns(), method_name, body))
+        except queue.Full:
+            self.dropped += 1
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        self.log_message(client_call_details.method, request)
+        return continuation(client_call_details, request)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        self.log_message(client_call_details.method, request)
+        return continuation(client_call_details, request)
+
+    @staticmethod
+    def encode(timestamp, method_name, body):
+        method = method_name.encode() if isinstance(method_name, str) else method_name
+        payload = body if isinstance(body, bytes) else body.SerializeToString()
+        return RECORD.pack(RECORD.size - 4 + len(method) + len(payload), timestamp, len(method)) + method + payload
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            chunk = []
+            while item is not None:
+                chunk.append(self.encode(*item))
+                if len(chunk) >= self.batch:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if chunk:
+                self.file.write(b''.join(chunk))
+                self.logged += len(chunk)
+            if item is None:
+                self.file.close()
+                return
+            if self.queue.empty():
+                self.file.flush()
+
+    def close(self):
+        """Writes out the queued requests and closes the file."""
+        self.queue.put(None)
+        self.thread.join(timeout=5.0)
+
+    def stats(self):
+        return f"{self.logged} requests logged to {self.log_file}, {self.dropped} dropped"
+
+
+def read_log(path):
+    """Yields (timestamp_ns, method, request bytes) from a binary log."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size or HEADER.unpack_from(data) != (LOG_MAGIC, LOG_VERSION):
+        raise ValueError(f"{path}: not a version {LOG_VERSION} P4Runtime request log")
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        length, timestamp, method_length = RECORD.unpack_from(data, offset)
+        end = offset + 4 + length
+        if end > len(data):
+            break  # the writer was stopped mid-record
+        start = offset + RECORD.size
+        yield timestamp, data[start:start + method_length].decode(), data[start + method_length:end]
+        offset = end
+
+
+def request_types():
+    """{method path: request message class} for the P4Runtime service."""
+    from p4.v1 import p4runtime_pb2
+    service = p4runtime_pb2.DESCRIPTOR.services_by_name['P4Runtime']
+    return {f"/{service.full_name}/{method.name}": getattr(p4runtime_pb2, method.input_type.name)
+            for method in service.methods}
+
+
+def to_text(path, out=sys.stdout):
+    """Writes a binary log in the text format of p4runtime_lib's GrpcRequestLogger."""
+    types = request_types()
+    for timestamp, method, payload in read_log(path):
+        stamp = datetime.datetime.fromtimestamp(timestamp / 1e9, datetime.timezone.utc)
+        ts = stamp.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        out.write("\n[%s] %s\n---\n" % (ts, method))
+        message_type = types.get(method)
+        if message_type is None:
+            out.write("(%d bytes of an unknown request type)\n" % len(payload))
+        else:
+            out.write(str(message_type.FromString(payload)))
+        out.write('---\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a binary P4Runtime request log to text')
+    parser.add_argument('log', help='Binary log written by AsyncRequestLogger')
+    args = parser.parse_args()
+    to_text(args.log)
@@ -1,12 +1,104 @@
+import hashlib
 import sys
+import threading
 import grpc
+import proto_log
 sys.path.append('/home/p4/tutorials/utils')
 import p4runtime_lib.bmv2
 import p4runtime_lib.helper
 import p4runtime_lib.switch
-from p4.v1 import p4runtime_pb2
+from p4.v1 import p4runtime_pb2, p4runtime_pb2_grpc
+from google.rpc import code_pb2, status_pb2
 
 
+class IndexedP4InfoHelper(p4runtime_lib.helper.P4InfoHelper):
+    """
+    P4InfoHelper with hash indexes instead of linear scans.
+
+    The upstream helper walks the p4info protobuf on every get(),
+    get_match_field() and get_action_param() call, and runs a regex in
+    __getattr__ for every get_<type>_id / get_<type>_name access. Here each
+    entity type is indexed by name, alias and id the first time it is used,
+    match fields and action params are indexed per table and action at load
+    time, and the synthesized get_<type>_id / get_<type>_name functions are
+    cached on the instance. The API and the errors raised are unchanged.
+    """
+
+    def __init__(self, p4_info_filepath):
+        super().__init__(p4_info_filepath)
+        self._entities = {}
+        self._match_fields = {}
+        for table in self.p4info.tables:
+            self._match_fields[table.preamble.name] = (
+                {mf.name: mf for mf in table.match_fields},
+                {mf.id: mf for mf in table.match_fields})
+        self._action_params = {}
+        for action in self.p4info.actions:
+            self._action_params[action.preamble.name] = (
+                {param.name: param for param in action.params},
+                {param.id: param for param in action.params})
+
+    def _index(self, entity_type):
+        index = self._entities.get(entity_type)
+        if index is None:
+            by_name, by_id = {}, {}
+            for o in getattr(self.p4info, entity_type):
+                pre = o.preamble
+                # Like the linear scan, the first entity with a given name or alias wins.
+                by_name.setdefault(pre.name, o)
+                if pre.alias:
+                    by_name.setdefault(pre.alias, o)
+                by_id.setdefault(pre.id, o)
+            index = self._entities[entity_type] = (by_name, by_id)
+        return index
+
+    def get(self, entity_type, name=None, id=None):
+        if name is not None and id is not None:
+            raise AssertionError("name or id must be None")
+
+        by_name, by_id = self._index(entity_type)
+        o = by_name.get(name) if name else by_id.get(id)
+        if o is not None:
+            return o
+
+        if name:
+            raise AttributeError("Could not find %r of type %s" % (name, entity_type))
+        else:
+            raise AttributeError("Could not find id %r of type %s" % (id, entity_type))
+
+    def __getattr__(self, attr):
+        function = super().__getattr__(attr)
+        # Only reached for names that are not attributes yet; cache so the regex runs once per name.
+        self.__dict__[attr] = function
+        return function
+
+    def get_match_field(self, table_name, name=None, id=None):
+        fields = self._match_fields.get(table_name)
+        if fields is not None:
+            if name is not None:
+                mf = fields[0].get(name)
+            elif id is not None:
+                mf = fields[1].get(id)
+            else:
+                mf = None
+            if mf is not None:
+                return mf
+        raise AttributeError("%r has no attribute %r" % (table_name, name if name is not None else id))
+
+    def get_action_param(self, action_name, name=None, id=None):
+        params = self._action_params.get(action_name)
+        if params is not None:
+            if name is not None:
+                param = params[0].get(name)
+            elif id is not None:
+                param = params[1].get(id)
+            else:
+                param = None
+            if param is not None:
+                return param
+        raise AttributeError("action %r has no param %r, (has: %r)" % (
+            action_name, name if name is not None else id, list(params[0]) if params else []))
+
 #debugging
 def printGrpcError(e):
     print("gRPC Error:", e.details(), end=' ')
@@ -39,111 +131,373 @@ def readRules(p4info_helper, sw):
                 print('%r' % p.value, end=' ')
             print()
 
-def modifyRules(p4info_helper, switch, rules):
+def buildRuleEntries(p4info_helper, rules, cache=None):
+    """
+    Builds the TableEntry of every rule in a rules list (see rules.py).
+
+    :param cache: Optional dict shared between calls (and switches); rules
+        that were built before are taken from it instead of being encoded again.
+    """
+    entries = []
+    for rule in rules:
+        key = repr((rule["table"], rule.get("match", {}), rule["action_name"], rule.get("action_params", {})))
+        entry = cache.get(key) if cache is not None else None
+        if entry is None:
+            entry = p4info_helper.buildTableEntry(
+                table_name=rule["table"],
+                match_fields=rule.get("match", {}),
+                action_name=rule["action_name"],
+                action_params=rule.get("action_params", {}))
+            if cache is not None:
+                cache[key] = entry
+        entries.append(entry)
+    return entries
+
+def writeErrors(e):
+    """
+    Extracts the per-update errors of a failed batch Write.
+
+    P4Runtime reports them in the google.rpc.Status of the call's
+    grpc-status-details-bin trailer: one p4.v1.Error per update, in update
+    order, with canonical_code OK for the updates that succeeded.
+
+    :param e: The grpc.RpcError raised by Write.
+    :return: A list with a p4runtime_pb2.Error (or None if the update succeeded)
+        per update, or None if the error carries no per-update details.
+    """
+    for key, value in e.trailing_metadata() or ():
+        if key == "grpc-status-details-bin":
+            status = status_pb2.Status()
+            status.ParseFromString(value)
+            errors = []
+            for detail in status.details:
+                error = p4runtime_pb2.Error()
+                detail.Unpack(error)
+                errors.append(None if error.canonical_code == code_pb2.OK else error)
+            return errors
+    return None
+
+def writeUpdates(switch, updates):
+    """
+    Sends (update_type, table_entry) pairs in a single WriteRequest.
+
+    :return: A list with the p4runtime_pb2.Error (or None) of every update.
+    :raises grpc.RpcError: If the call failed without per-update details (e.g. the switch is gone).
+    """
+    request = p4runtime_pb2.WriteRequest()
+    request.device_id = switch.device_id
+    request.election_id.high = switch.current_election_id[0]
+    request.election_id.low = switch.current_election_id[1]
+    for update_type, table_entry in updates:
+        update = request.updates.add()
+        update.type = update_type
+        update.entity.table_entry.CopyFrom(table_entry)
+    try:
+        switch.client_stub.Write(request)
+    except grpc.RpcError as e:
+        errors = writeErrors(e)
+        if errors is None or len(errors) != len(updates):
+            raise
+        return errors
+    return [None] * len(updates)
+
+def writeEntries(switch, table_entries, update_type=p4runtime_pb2.Update.INSERT, chunk_size=128,
+                 modify_if_exists=True):
+    """
+    Writes table entries in batched WriteRequests of up to chunk_size updates.
+
+    Default-action entries are always sent as MODIFY. INSERTs rejected with
+    ALREADY_EXISTS are retried as one batched MODIFY when modify_if_exists is set.
+
+    :param switch: The switch connection object.
+    :param table_entries: TableEntry messages to write.
+    :param update_type: p4runtime_pb2.Update.INSERT or MODIFY (or DELETE).
+    :param chunk_size: Maximum updates per WriteRequest.
+    :param modify_if_exists: Retry INSERTs of existing entries as MODIFY.
+    :return: A list of (table_entry, p4runtime_pb2.Error) for the updates that failed.
+    """
+    MODIFY = p4runtime_pb2.Update.MODIFY
+    failed = []
+    for start in range(0, len(table_entries), max(1, chunk_size)):
+        updates = [(MODIFY if entry.is_default_action else update_type, entry)
+                   for entry in table_entries[start:start + chunk_size]]
+        retry = []
+        for (kind, entry), error in zip(updates, writeUpdates(switch, updates)):
+            if error is None:
+                continue
+            if (modify_if_exists and kind == p4runtime_pb2.Update.INSERT
+                    and error.canonical_code == code_pb2.ALREADY_EXISTS):
+                retry.append((MODIFY, entry))
+            else:
+                failed.append((entry, error))
+        if retry:
+            failed.extend((entry, error) for (_, entry), error in zip(retry, writeUpdates(switch, retry))
+                          if error is not None)
+    return failed
+
+def printWriteFailures(p4info_helper, switch, failed):
+    """Prints the (table_entry, error) pairs returned by writeEntries."""
+    for entry, error in failed:
+        table_name = p4info_helper.get_tables_name(entry.table_id)
+        print(f"Write failed on {switch.name} for {table_name}: "
+              f"{code_pb2.Code.Name(error.canonical_code)} {error.message}")
+
+def modifyRules(p4info_helper, switch, rules, chunk_size=128):
     """
     Updates the rules on the specified switch.
 
     :param p4info_helper: The P4Info helper object.
     :param switch: The switch connection object.
     :param rules: A list of rules to install on the switch.
+    :param chunk_size: Maximum rules per WriteRequest.
     """
-    print(f"Updating rules on {switch.name}...")
-
+    print(f"Modifying existing rules on {switch.name}...")
     try:
-        print(f"Modifying existing rules on {switch.name}...")
-        for rule in rules:
-            table_name = rule["table"]
-            match_fields = rule["match"]
-            action_name = rule["action_name"]
-            action_params = rule["action_params"]
-
-            # Build the updated table entry
-            table_entry = p4info_helper.buildTableEntry(
-                table_name=table_name,
-                match_fields=match_fields,
-                action_name=action_name,
-                action_params=action_params
-            )
-            # Use ModifyTableEntry to update the table entry
-            switch.ModifyTableEntry(table_entry)
-            print(f"Modified rule on {switch.name}: {match_fields} -> {action_name} {action_params}")
+        failed = writeEntries(switch, buildRuleEntries(p4info_helper, rules),
+                              p4runtime_pb2.Update.MODIFY, chunk_size)
+        printWriteFailures(p4info_helper, switch, failed)
+        print(f"Modified {len(rules) - len(failed)} of {len(rules)} rules on {switch.name}")
     except grpc.RpcError as e:
         printGrpcError(e)
 
-def writeRules(p4info_helper, switch, rules):
+def writeRules(p4info_helper, switch, rules, chunk_size=128, cache=None):
     """
-    Installs static rules on a switch based on the provided rules.
+    Installs static rules on a switch based on the provided rules, in
+    batched WriteRequests. Rules that already exist are modified instead.
 
     :param p4info_helper: The P4Info helper object.
     :param switch: The switch connection object.
     :param rules: A list of rules to install on the switch.
+    :param chunk_size: Maximum rules per WriteRequest.
+    :param cache: Optional entry cache shared between switches (see buildRuleEntries).
     """
-    for rule in rules:
-        table_name = rule["table"]
-        match_fields = rule.get("match", {})
-        action_name = rule["action_name"]
-        action_params = rule.get("action_params", {})
-
-        # Build the table entry
-        table_entry = p4info_helper.buildTableEntry(
-            table_name=table_name,
-            match_fields=match_fields,
-            action_name=action_name,
-            action_params=action_params
-        )
-
-        # Write the table entry to the switch
-        try:
-            switch.WriteTableEntry(table_entry)
-            print(f"Installed rule on {switch.name}: {match_fields} -> {action_name} {action_params}")
-        except grpc.RpcError as e:
-            printGrpcError(e)
-
-def packet_out(p4info_helper, switch, packet):
-    egress_port = 2
-    packetout = p4info_helper.buildPacketOut(
-        payload = packet,
-        metadata = {
-            1: egress_port.to_bytes(2, byteorder='big')
-        }
-    )
-    switch.PacketOut(packetout)
-
-
-
-# Pre-construct the base packet as a byte array
-def create_pdc_request_packet(p4info_helper):
-    """
-    Creates a base Ethernet/IP packet as a byte array.
-    """
-    base_packet = b'\x08\x00\x00\x00\x01\x11'  # Ethernet src (08:00:00:00:01:11)
-    base_packet += b'\x08\x00\x00\x00\x02\x22'  # Ethernet dst (08:00:00:00:02:22)
-    base_packet += b'\x08\x00'  # EtherType (IPv4)
-    base_packet += b'\x45\x00\x00\x3c\x00\x00\x40\x00\x40\x11\xb7\xe6'  # IPv4 header
-    base_packet += b'\x0a\x00\x01\x01'  # IPv4 src (10.0.1.1)
-    base_packet += b'\x0a\x00\x02\x02'  # IPv4 dst (10.0.2.2)
-    base_packet += b'available_pdc_request'  # Payload
-
-    #base_packet = p4info_helper.buildPacketOut(base_packet, {2: ("\100\000").encode()})
-
-    return base_packet
-
-def modify_packet(base_packet, new_dst_ip, new_dst_mac):
-    """
-    Modifies the destination IP and MAC address in the base packet.
-
-    :param base_packet: The pre-constructed base packet (bytes).
-    :param new_dst_ip: The new destination IP address (string, e.g., "10.0.3.3").
-    :param new_dst_mac: The new destination MAC address (string, e.g., "08:00:00:00:03:33").
-    :return: The modified packet (bytes).
-    """
-    # Convert IP and MAC to bytes
-    dst_ip_bytes = bytes(map(int, new_dst_ip.split('.')))
-    dst_mac_bytes = bytes(int(x, 16) for x in new_dst_mac.split(':'))
-
-    # Replace the destination MAC (bytes 0-5) and destination IP (bytes 30-33)
-    modified_packet = bytearray(base_packet)
-    modified_packet[0:6] = dst_mac_bytes
-    modified_packet[30:34] = dst_ip_bytes
-
-    return bytes(modified_packet)
\ No newline at end of file
+    try:
+        failed = writeEntries(switch, buildRuleEntries(p4info_helper, rules, cache), chunk_size=chunk_size)
+        printWriteFailures(p4info_helper, switch, failed)
+        print(f"Installed {len(rules) - len(failed)} of {len(rules)} rules on {switch.name} "
+              f"({-(-len(rules) // max(1, chunk_size))} WriteRequests of up to {chunk_size})")
+    except grpc.RpcError as e:
+        printGrpcError(e)
+
+PROTO_LOG_MODES = ('binary', 'text', 'off')
+
+class SharedConfigSwitchConnection(p4runtime_lib.bmv2.Bmv2SwitchConnection):
+    """
+    Bmv2SwitchConnection that builds the device config of a BMv2 JSON file
+    once per process, so pushing the same program to many switches reads
+    and encodes it only once.
+
+    Requests are logged to proto_dump_file by proto_log.AsyncRequestLogger
+    (binary, from a background thread) unless log_mode is 'text', which
+    keeps p4runtime_lib's synchronous text dump for debugging, or 'off'.
+    """
+
+    device_configs = {}
+    device_configs_lock = threading.Lock()
+
+    def __init__(self, name=None, address='127.0.0.1:50051', device_id=0, proto_dump_file=None,
+                 log_mode='binary'):
+        if log_mode not in PROTO_LOG_MODES:
+            raise ValueError(f"unknown proto log mode {log_mode!r}, expected one of {PROTO_LOG_MODES}")
+        self.request_logger = None
+        if log_mode != 'binary' or proto_dump_file is None:
+            super().__init__(name=name, address=address, device_id=device_id,
+                             proto_dump_file=proto_dump_file if log_mode == 'text' else None)
+            return
+        # SwitchConnection.__init__ with the asynchronous logger in place of GrpcRequestLogger
+        self.name = name
+        self.address = address
+        self.device_id = device_id
+        self.p4info = None
+        self.channel = grpc.insecure_channel(self.address)
+        self.request_logger = proto_log.AsyncRequestLogger(proto_dump_file)
+        self.channel = grpc.intercept_channel(self.channel, self.request_logger)
+        self.client_stub = p4runtime_pb2_grpc.P4RuntimeStub(self.channel)
+        self.requests_stream = p4runtime_lib.switch.IterableQueue()
+        self.stream_msg_resp = self.client_stub.StreamChannel(iter(self.requests_stream))
+        self.dispatcher = p4runtime_lib.switch.StreamDispatcher(self.stream_msg_resp)
+        self.proto_dump_file = proto_dump_file
+        p4runtime_lib.switch.connections.append(self)
+
+    def shutdown(self):
+        super().shutdown()
+        if self.request_logger:
+            self.request_logger.close()
+            print(f"{self.name}: {self.request_logger.stats()}")
+
+    def buildDeviceConfig(self, bmv2_json_file_path=None, **kwargs):
+        with self.device_configs_lock:
+            config = self.device_configs.get(bmv2_json_file_path)
+            if config is None:
+                config = self.device_configs[bmv2_json_file_path] = p4runtime_lib.bmv2.buildDeviceConfig(
+                    bmv2_json_file_path=bmv2_json_file_path)
+        return config
+
+def pipelineCookie(p4info, bmv2_json_file_path):
+    """
+    Identifies a P4 program: the first 8 bytes of the SHA-256 of its P4Info
+    and its BMv2 JSON, as the u64 used for ForwardingPipelineConfig.cookie.
+    """
+    digest = hashlib.sha256(p4info.SerializeToString(deterministic=True))
+    with open(bmv2_json_file_path, 'rb') as f:
+        digest.update(f.read())
+    return int.from_bytes(digest.digest()[:8], 'big')
+
+def getPipelineCookie(switch):
+    """
+    Returns the cookie of the pipeline installed on the switch, or None if
+    it has no pipeline, one that was pushed without a cookie, or the target
+    cannot report it.
+    """
+    request = p4runtime_pb2.GetForwardingPipelineConfigRequest()
+    request.device_id = switch.device_id
+    request.response_type = p4runtime_pb2.GetForwardingPipelineConfigRequest.COOKIE_ONLY
+    try:
+        response = switch.client_stub.GetForwardingPipelineConfig(request)
+    except grpc.RpcError as e:
+        if e.code() in (grpc.StatusCode.FAILED_PRECONDITION, grpc.StatusCode.NOT_FOUND,
+                        grpc.StatusCode.UNIMPLEMENTED):
+            return None
+        raise
+    if not response.config.HasField("cookie"):
+        return None
+    return response.config.cookie.cookie
+
+def setPipelineConfig(switch, p4info, bmv2_json_file_path, cookie):
+    """Like switch.SetForwardingPipelineConfig (VERIFY_AND_COMMIT), with the pipeline's cookie set."""
+    request = p4runtime_pb2.SetForwardingPipelineConfigRequest()
+    request.device_id = switch.device_id
+    request.election_id.high = switch.current_election_id[0]
+    request.election_id.low = switch.current_election_id[1]
+    request.config.p4info.CopyFrom(p4info)
+    request.config.p4_device_config = switch.buildDeviceConfig(
+        bmv2_json_file_path=bmv2_json_file_path).SerializeToString()
+    request.config.cookie.cookie = cookie
+    request.action = p4runtime_pb2.SetForwardingPipelineConfigRequest.VERIFY_AND_COMMIT
+    switch.client_stub.SetForwardingPipelineConfig(request)
+
+def readTableEntries(switch):
+    """All (non-default) table entries installed on the switch, from one wildcard Read."""
+    return [entity.table_entry for response in switch.ReadTableEntries()
+            for entity in response.entities]
+
+def _canonical(value):
+    """P4Runtime bytestring without leading zero bytes; servers may return either form."""
+    return value.lstrip(b'\0') or b'\0'
+
+def entryKey(entry):
+    """What identifies a table entry: table, match and priority, with canonical byte strings."""
+    match = []
+    for field in sorted(entry.match, key=lambda field: field.field_id):
+        kind = field.WhichOneof("field_match_type")
+        if kind == "exact":
+            values = (_canonical(field.exact.value),)
+        elif kind == "lpm":
+            values = (_canonical(field.lpm.value), field.lpm.prefix_len)
+        elif kind == "ternary":
+            values = (_canonical(field.ternary.value), _canonical(field.ternary.mask))
+        elif kind == "range":
+            values = (_canonical(field.range.low), _canonical(field.range.high))
+        else:
+            values = (getattr(field, kind).SerializeToString(deterministic=True),)
+        match.append((field.field_id, kind) + values)
+    return entry.table_id, tuple(match), entry.priority
+
+def entryAction(entry):
+    """What a table entry does: action id and canonical parameters."""
+    action = entry.action.action
+    return action.action_id, tuple(sorted((param.param_id, _canonical(param.value)) for param in action.params))
+
+def diffEntries(installed, desired):
+    """
+    Minimal changes that turn the installed entries into the desired ones.
+
+    :return: (inserts, modifies, deletes) as lists of TableEntry.
+    """
+    current = {entryKey(entry): entry for entry in installed}
+    wanted = {entryKey(entry): entry for entry in desired}
+    inserts = [entry for key, entry in wanted.items() if key not in current]
+    modifies = [entry for key, entry in wanted.items()
+                if key in current and entryAction(current[key]) != entryAction(entry)]
+    deletes = [entry for key, entry in current.items() if key not in wanted]
+    return inserts, modifies, deletes
+
+def reconcileEntries(switch, installed, desired, chunk_size=128):
+    """
+    Applies diffEntries(installed, desired) in batched writes: deletes, then
+    modifies, then inserts.
+
+    :return: ((inserts, modifies, deletes) counts, failures as in writeEntries).
+    """
+    inserts, modifies, deletes = diffEntries(installed, desired)
+    failed = []
+    for entries, update_type in ((deletes, p4runtime_pb2.Update.DELETE),
+                                 (modifies, p4runtime_pb2.Update.MODIFY),
+                                 (inserts, p4runtime_pb2.Update.INSERT)):
+        if entries:
+            failed.extend(writeEntries(switch, entries, update_type, chunk_size))
+    return (len(inserts), len(modifies), len(deletes)), failed
+
+class PrecompiledWrites:
+    """
+    WriteRequests built and serialized ahead of time, keyed by scenario.
+
+    Sending one is a dict lookup plus a single gRPC call: the request bytes
+    go out as they are, with no P4Info lookups, address encoding or protobuf
+    construction on the way. Build them after MasterArbitrationUpdate, since
+    they carry the connection's election id.
+    """
+
+    def __init__(self, switch):
+        """
+        :param switch: The switch connection object.
+        """
+        self.switch = switch
+        self.requests = {}
+        # Bypasses the request serializer: the stored requests are already bytes.
+        self.write = switch.channel.unary_unary('/p4.v1.P4Runtime/Write', request_serializer=None,
+                                                response_deserializer=p4runtime_pb2.WriteResponse.FromString)
+
+    def add(self, key, table_entries, update_type=p4runtime_pb2.Update.MODIFY):
+        """
+        Serializes a WriteRequest with one update per table entry under key.
+
+        :param key: Any hashable scenario key.
+        :param table_entries: TableEntry messages, e.g. from p4info_helper.buildTableEntry.
+        :param update_type: The p4runtime_pb2.Update type of every update.
+        """
+        request = p4runtime_pb2.WriteRequest()
+        request.device_id = self.switch.device_id
+        request.election_id.high = self.switch.current_election_id[0]
+        request.election_id.low = self.switch.current_election_id[1]
+        for table_entry in table_entries:
+            update = request.updates.add()
+            update.type = update_type
+            update.entity.table_entry.CopyFrom(table_entry)
+        self.requests[key] = request.SerializeToString()
+
+    def __contains__(self, key):
+        return key in self.requests
+
+    def __len__(self):
+        return len(self.requests)
+
+    def send(self, key):
+        """Sends the request stored under key; raises grpc.RpcError like the switch's own calls."""
+        return self.write(self.requests[key])
+
+def printGrpcErrorReport(e):
+    """
+    Prints a gRPC error followed by the P4Runtime error report in its
+    trailing metadata, if there is one.
+
+    :param e: The grpc.RpcError.
+    """
+    printGrpcError(e)
+    for item in e.trailing_metadata() or ():
+        if item[0] == "p4-runtime-error-bin":
+            error = p4runtime_pb2.Error()
+            error.ParseFromString(item[1])
+            print("\n--- P4Runtime Error Report ---")
+            print(error)
+            break
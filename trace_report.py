@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Per-stage failover latency from the trace files of PDCs and controllers
+(see failover_trace.py).
+
+Events are grouped into incidents per failed PDC: an incident starts with
+the first shutdown notification, heartbeat suspicion or PDC-down digest for
+that PDC and collects its events for --window seconds. Every stage is
+reported as "stage@node" with its offset from the start of the incident,
+e.g. rule_installed@s1 or first_row@pdc2 (the backup PDC storing the first
+row of a rerouted PMU). First rows are recorded under the PMU's IP, so they
+are matched to an incident through the PMUs' home PDCs from --pmu-config
+and --topology: only a PMU of the failed PDC counts. Offers (rtype 1) are
+keyed by the backup, not the failed PDC, and are left out.
+
+    python3 trace_report.py logs/trace-*.bin pdc_data/*.trace
+    python3 trace_report.py logs/*.trace --slo rule_installed=50 --slo first_row=250
+"""
+import argparse
+import glob
+import os
+import socket
+import sys
+
+import failover_trace as ft
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+START_STAGES = (ft.PDC_NOTIFY_SENT, ft.HEARTBEAT_SUSPECTED, ft.DIGEST_RECEIVED)
+RTYPE_STAGES = (ft.DIGEST_RECEIVED, ft.HANDLER_START, ft.HANDLER_END, ft.NOTIFY_SENT)
+
+
+def load(paths):
+    """All events of all files as (timestamp_ns, key, stage, extra, node), in time order."""
+    events = []
+    for path in paths:
+        node, records = ft.read_trace(path)
+        events.extend(record + (node,) for record in records)
+    events.sort()
+    return events
+
+
+def incidents(events, window_ns, homes=None):
+    """
+    Groups events into incidents.
+
+    :param homes: {PMU IP key: home PDC IP key} (see failover_trace.pmu_homes); a first row only belongs to an
+        incident of its PMU's home PDC. None matches the first row of any source.
+    :return: A list of (key, start_ns, {label: offset_ms}) in start order.
+    """
+    found = []
+    open_incidents = {}
+    first_rows = []
+    for timestamp, key, stage, extra, node in events:
+        if stage == ft.FIRST_ROW:
+            first_rows.append((timestamp, key, node))
+            continue
+        if stage in RTYPE_STAGES and extra:
+            continue
+        incident = open_incidents.get(key)
+        if incident is None or timestamp - incident[1] > window_ns:
+            if stage not in START_STAGES:
+                continue
+            incident = open_incidents[key] = (key, timestamp, {})
+            found.append(incident)
+        label = f"{ft.STAGES.get(stage, stage)}@{node}"
+        incident[2].setdefault(label, (timestamp - incident[1]) / 1e6)
+
+    for key, start, stages in found:
+        for timestamp, source, node in first_rows:
+            if homes is not None and homes.get(source) != key:
+                continue
+            if start <= timestamp <= start + window_ns:
+                stages[f"first_row@{node}"] = (timestamp - start) / 1e6
+                break
+    return found
+
+
+def quantile(values, q):
+    """Nearest-rank quantile of a sorted list."""
+    return values[min(len(values) - 1, max(0, int(q * len(values) + 0.999999) - 1))]
+
+
+def stage_offsets(found, name):
+    """Per-incident offsets of a label ('stage@node'), or of the earliest node for a bare stage name."""
+    offsets = []
+    for _, _, stages in found:
+        if '@' in name:
+            value = stages.get(name)
+        else:
+            value = min((offset for label, offset in stages.items() if label.split('@')[0] == name), default=None)
+        if value is not None:
+            offsets.append(value)
+    return sorted(offsets)
+
+
+def render(found, window, out=sys.stdout):
+    labels = {}
+    for _, _, stages in found:
+        for label in stages:
+            labels[label] = None
+    rows = [(label, stage_offsets(found, label)) for label in labels]
+    rows.sort(key=lambda row: quantile(row[1], 0.5))
+    print(f"{len(found)} incidents; offsets from incident start in ms", file=out)
+    print(f"Events are joined by the failed PDC's IP within {window:g} s (net_hdr and the net_report_t digest "
+          f"carry no incident id), so overlapping failures of one PDC merge; offsets across hosts assume "
+          f"synchronised clocks.", file=out)
+    print(f"{'stage':<32} {'n':>5} {'min':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}", file=out)
+    for label, values in rows:
+        print(f"{label:<32} {len(values):>5} {values[0]:>9.3f} {quantile(values, 0.5):>9.3f} "
+              f"{quantile(values, 0.9):>9.3f} {quantile(values, 0.99):>9.3f} {values[-1]:>9.3f}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage failover latency from trace files')
+    parser.add_argument('traces', nargs='+', help='Trace files (globs are expanded)')
+    parser.add_argument('--window', type=float, default=5.0,
+                        help='Seconds after its start that events still belong to an incident')
+    parser.add_argument('--incidents', action='store_true', help='Also list every incident')
+    parser.add_argument('--pmu-config', type=str, default=os.path.join(project_root, 'pmu_config.json'),
+                        help='PMU settings: the PDC every PMU reports to')
+    parser.add_argument('--topology', type=str, default=os.path.join(project_root, 'topology.json'),
+                        help='Topology: the IP of every PMU')
+    parser.add_argument('--slo', action='append', default=[], metavar='STAGE=MS',
+                        help="Latency objective, e.g. rule_installed=50 or first_row@pdc2=250 (repeatable)")
+    parser.add_argument('--quantile', type=float, default=0.99,
+                        help='Quantile the --slo objectives are checked against')
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.traces for path in (sorted(glob.glob(pattern)) or [pattern])]
+    try:
+        homes = {ft.ip_key(pmu): ft.ip_key(pdc)
+                 for pmu, pdc in ft.pmu_homes(args.pmu_config, args.topology).items()}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: cannot map PMUs to their PDCs ({e}); first rows of any PMU are matched.",
+              file=sys.stderr)
+        homes = None
+    found = incidents(load(paths), int(args.window * 1e9), homes)
+    if not found:
+        print("No incidents in the trace files.")
+        return 0
+
+    if args.incidents:
+        for key, start, stages in found:
+            ip = socket.inet_ntoa(key.to_bytes(4, 'big'))
+            print(f"{ip} at {start / 1e9:.6f}: "
+                  + ', '.join(f"{label} +{offset:.3f}" for label, offset in sorted(stages.items(), key=lambda s: s[1])))
+        print()
+    render(found, args.window)
+
+    violated = False
+    for slo in args.slo:
+        name, _, limit = slo.partition('=')
+        values = stage_offsets(found, name)
+        if not values:
+            print(f"SLO {name} <= {limit} ms: no samples")
+            violated = True
+            continue
+        value = quantile(values, args.quantile)
+        ok = value <= float(limit)
+        violated |= not ok
+        print(f"SLO {name} p{args.quantile * 100:g} <= {limit} ms: {value:.3f} ms "
+              f"over {len(values)} incidents -> {'PASS' if ok else 'FAIL'}")
+    return 1 if violated else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())